@@ -1,41 +1,163 @@
+import os
+import threading
 from pupil_apriltags import Detector
 import cv2
-from drawimages import DrawImages
-
-detector = Detector(
-    # our type of april tag, contains 36 bits, atleast 11 bits diff between ids.
-    families="tag36h11",
-    # use 4 cpu cores to make detection faster. most cpus have 4-8 cores so its ok for computer need check on raspberry
-    nthreads=4,
-    # shrink img by half. pros faster cons miss small tags
-    #quad_decimate=2.0,
-    quad_decimate=1.0,
-    #after a tag is found it goes back to full size to make edges
-    refine_edges=True,
-    decode_sharpening=0.25,
-)
+import numpy as np
+import drawimages
+from drawimages import Overlay
+
+
+def default_nthreads():
+    # use the cores we have (a raspberry has 4, a pc 4-16) but leave one for YOLO
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def make_detector(quad_decimate=1.0, nthreads=None):
+    return Detector(
+        # our type of april tag, contains 36 bits, atleast 11 bits diff between ids.
+        families="tag36h11",
+        # more cpu cores make detection faster
+        nthreads=nthreads if nthreads is not None else default_nthreads(),
+        # shrink img by quad_decimate (2.0 = half). pros faster cons miss small tags
+        quad_decimate=quad_decimate,
+        #after a tag is found it goes back to full size to make edges
+        refine_edges=True,
+        decode_sharpening=0.25,
+    )
+
+
+detector = make_detector(quad_decimate=1.0)
 TAG_SIZE=0.08
-def detect_apriltags(frame,camera_params):
+
+# one Detector per (quad_decimate, nthreads), building them is slow
+_detectors = {(1.0, None): detector}
+
+
+def get_detector(quad_decimate, nthreads=None):
+    key = (float(quad_decimate), nthreads)
+    if key not in _detectors:
+        _detectors[key] = make_detector(quad_decimate, nthreads)
+    return _detectors[key]
+
+
+class DetectionConfig:
     """
-    Runs AprilTag detection on a single frame, draws the tags,
-    and returns april_poses and list of found tag IDs.
+    How hard detect_apriltags should look.
 
-    april_poses[tag_id] = [x, y, z]  (in meters, camera coordinate frame)
+    mode = "speed"    -> only the coarse pass (shrunk image, fast)
+           "recall"   -> only the full resolution pass (the old behaviour)
+           "adaptive" -> coarse pass first, full resolution only if one of
+                         the expected_ids is missing
+    coarse_decimate = quad_decimate of the coarse pass (2.0 = half size)
+    fine_decimate   = quad_decimate of the full pass
+    expected_ids    = the tags that should always be on the table
+    nthreads        = detector threads, None = sized from the cpu cores
+
+    found_by[tag_id] says which quad_decimate found each tag of the last
+    detection with this config. The config is shared, so use the found_by
+    that comes with the poses (TagPose.found_by) to know it for a result.
     """
 
-    april_poses = {}
-    drawing_ops = []
+    def __init__(self, mode="adaptive", coarse_decimate=2.0, fine_decimate=1.0,
+                 expected_ids=(0, 1, 2), nthreads=None):
+        if mode not in ("speed", "recall", "adaptive"):
+            raise ValueError(f"unknown mode {mode}")
+        self.mode = mode
+        self.coarse_decimate = coarse_decimate
+        self.fine_decimate = fine_decimate
+        self.expected_ids = tuple(expected_ids)
+        self.nthreads = nthreads
 
-    # rgb to gray scale
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.found_by = {}
+        # counters
+        self.coarse_passes = 0
+        self.fine_passes = 0
+
+
+def _detect_with(detector_to_use, gray, camera_params):
     # scan gray photos for squares
-    results = detector.detect(
+    return detector_to_use.detect(
         gray,
         estimate_tag_pose=True,  # Don't just find the tag in 2D; do the complex linear algebra to figure out its 3D position.
         camera_params=camera_params,  # use what we forced
         tag_size=TAG_SIZE,
     )
 
+
+def find_apriltags(gray, camera_params, config=None, with_found_by=False):
+    """
+    Raw AprilTag detection on a gray image.
+    Returns the pupil_apriltags detections (tag_id, center, corners, pose_t, pose_R).
+
+    config = DetectionConfig, None uses the module detector (full resolution).
+    with_found_by = True returns (detections, found_by), found_by[tag_id] =
+                    the quad_decimate of the pass that found the tag.
+    """
+    if config is None:
+        results = _detect_with(detector, gray, camera_params)
+        if with_found_by:
+            # the module detector runs at full resolution
+            return results, {r.tag_id: 1.0 for r in results}
+        return results
+
+    found_by = {}
+    results = []
+    if config.mode in ("speed", "adaptive"):
+        coarse = get_detector(config.coarse_decimate, config.nthreads)
+        results = _detect_with(coarse, gray, camera_params)
+        config.coarse_passes += 1
+        for r in results:
+            found_by[r.tag_id] = config.coarse_decimate
+
+    found = {r.tag_id for r in results}
+    missing = [tag_id for tag_id in config.expected_ids if tag_id not in found]
+    if config.mode == "recall" or (config.mode == "adaptive" and missing):
+        fine = get_detector(config.fine_decimate, config.nthreads)
+        fine_results = _detect_with(fine, gray, camera_params)
+        config.fine_passes += 1
+        # keep what the coarse pass found, add what only the full pass found
+        for r in fine_results:
+            if r.tag_id not in found:
+                results.append(r)
+                found_by[r.tag_id] = config.fine_decimate
+    config.found_by = found_by
+    if with_found_by:
+        return results, found_by
+    return results
+
+
+class TagPose(list):
+    """
+    [x, y, z] of a tag in meters (camera frame), like before, plus its
+    rotation R (3x3, tag frame -> camera frame) for TablePlane and
+    found_by, the quad_decimate of the pass that found it (None = unknown).
+    """
+    __slots__ = ("R", "found_by")
+
+    def __init__(self, xyz, R=None, found_by=None):
+        super().__init__(xyz)
+        self.R = R
+        self.found_by = found_by
+
+
+def poses_from_detections(results, camera_params=None, undistorter=None, found_by=None):
+    """
+    april_poses[tag_id] = TagPose [x, y, z] (or None if the pose failed)
+
+    found_by    = optional {tag_id: quad_decimate} from find_apriltags,
+                  kept on every TagPose
+
+    undistorter = optional PointUndistorter (undistort.py). The detector
+                  computes the pose from the distorted corners, with it we
+                  undistort all the corners in one call and solve the pose
+                  again from them (needs camera_params).
+    """
+    if found_by is None:
+        found_by = {}
+    if undistorter is not None and results:
+        return undistorted_poses(results, camera_params, undistorter, found_by)
+
+    april_poses = {}
     for r in results:
         # ------------------------------------------
         # Extract pose
@@ -43,46 +165,203 @@ def detect_apriltags(frame,camera_params):
         t = r.pose_t
         if t is not None:
             x, y, z = t.flatten()
-            april_poses[r.tag_id] = [x, y, z]
+            april_poses[r.tag_id] = TagPose([x, y, z], r.pose_R, found_by.get(r.tag_id))
         else:
             april_poses[r.tag_id] = None  # still returned but no pose
+    return april_poses
+
+
+# corners of the tag in its own frame, in the order the detector gives them
+# (the same square the apriltag library solves the pose with)
+_TAG_CORNERS = np.array(
+    [[-1, 1, 0], [1, 1, 0], [1, -1, 0], [-1, -1, 0]], dtype=np.float64
+) * (TAG_SIZE / 2)
+
+
+def undistorted_poses(results, camera_params, undistorter, found_by=None):
+    """Tag poses from the undistorted corners (see poses_from_detections)."""
+    fx, fy, cx, cy = camera_params
+    K = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float64)
+
+    # every corner of every tag in one call
+    corners = undistorter.points(np.concatenate([r.corners for r in results])).reshape(-1, 4, 2)
 
+    april_poses = {}
+    for r, img_pts in zip(results, corners):
+        ok, rvec, tvec = cv2.solvePnP(_TAG_CORNERS, img_pts, K, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+        if ok:
+            april_poses[r.tag_id] = TagPose(tvec.flatten().tolist(), cv2.Rodrigues(rvec)[0],
+                                            (found_by or {}).get(r.tag_id))
+        else:
+            april_poses[r.tag_id] = None
+    return april_poses
+
+
+def tag_overlay(results):
+    """The tags (box + id) and their corners (green dots) as an Overlay."""
+    overlay = Overlay()
+
+    for r in results:
         # ------------------------------------------
         # Bounding box for AprilTag
         # r.corners is 4 points:
         # p0, p1, p2, p3  -> get min/max to form box
         # ------------------------------------------
-        xs = [int(p[0]) for p in r.corners]
-        ys = [int(p[1]) for p in r.corners]
-        x1, y1 = min(xs), min(ys)
-        x2, y2 = max(xs), max(ys)
+        xs = r.corners[:, 0].astype(int)
+        ys = r.corners[:, 1].astype(int)
+        box = (xs.min(), ys.min(), xs.max(), ys.max())
 
-        # ------------------------------------------
-        # Create drawing object
-        # ------------------------------------------
-        tag_label = f"ID {r.tag_id}"
-
-        draw_tag = DrawImages(
-            x=r.center[0],
-            y=r.center[1],
-            label=tag_label,
-            color=(255, 0, 0),  # blue-ish for tags
-            box=(x1, y1, x2, y2),
-        )
-
-        # Schedule tag drawing (rectangle + text + center)
-        drawing_ops.append(draw_tag.draw_tag)
+        # blue-ish for tags
+        overlay.tag(r.center[0], r.center[1], f"ID {r.tag_id}", (255, 0, 0), box=box)
 
         # ------------------------------------------
         # draw corners as green dots
         # ------------------------------------------
         for (px, py) in r.corners:
-            highlight = DrawImages(px, py, "", (0, 255, 0))
-            drawing_ops.append(highlight.draw_card)  # small green dot
+            overlay.card(px, py, "", (0, 255, 0))
+    return overlay
+
 
+# one gray image per thread, reused every frame instead of a new 2 MB array
+_gray = threading.local()
 
-    for draw in drawing_ops:
-        draw(frame)
+
+def to_gray(frame):
+    """The gray version of frame, in a buffer that is reused by the next call (same thread)."""
+    buf = getattr(_gray, "buf", None)
+    if buf is None or buf.shape != frame.shape[:2]:
+        buf = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _gray.buf = buf
+        return buf
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=buf)
+
+
+def draw_detections(frame, results):
+    # nobody looks at the frames in headless runs
+    if drawimages.headless:
+        return
+    tag_overlay(results).draw(frame)
+
+
+def detect_apriltags(frame,camera_params,config=None,draw=True,undistorter=None):
+    """
+    Runs AprilTag detection on a single frame, draws the tags,
+    and returns april_poses and list of found tag IDs.
+
+    april_poses[tag_id] = [x, y, z]  (in meters, camera coordinate frame,
+                          a TagPose, .R is the rotation of the tag and
+                          .found_by the quad_decimate that found it)
+    config = optional DetectionConfig (speed / recall / adaptive)
+    draw   = False only reads the frame (no drawing, so no copy is needed)
+    undistorter = optional PointUndistorter, poses from undistorted corners
+    """
+
+    # rgb to gray scale
+    gray = to_gray(frame)
+    results, found_by = find_apriltags(gray, camera_params, config, with_found_by=True)
+
+    april_poses = poses_from_detections(results, camera_params, undistorter, found_by)
+    if draw:
+        draw_detections(frame, results)
 
     found_tags = list(april_poses.keys())
     return frame, april_poses, found_tags
+
+
+class TagPoseCache:
+    """
+    Our tags are taped to the table, so there is no reason to find them
+    again on every frame.
+
+    Full detection runs only every `redetect_every` frames. In between we
+    just compare small gray patches around every tag corner with how they
+    looked when the tag was found. If they changed by more than
+    `drift_threshold` (mean pixel difference) the tag moved (or something
+    covers it) and we detect again right away. Otherwise every frame gets
+    the cached poses.
+
+    A detection is only reused while it has all of `required_ids` (default:
+    the expected_ids of config, or tags 0 and 1). If one of them is missing
+    (covered by a hand for a moment) every frame runs the full detection
+    until it is back, and an empty detection is never reused.
+
+    Has the same detect(frame, camera_params, draw) result as detect_apriltags.
+    """
+
+    def __init__(self, redetect_every=30, drift_threshold=20, patch_size=8, config=None,
+                 undistorter=None, required_ids=None):
+        if required_ids is None:
+            required_ids = config.expected_ids if config is not None else (0, 1)
+        self.required_ids = tuple(required_ids)
+        self.redetect_every = redetect_every
+        self.drift_threshold = drift_threshold
+        self.patch_size = patch_size       # half size of the corner patch, pixels
+        self.config = config               # DetectionConfig for the real detections
+        self.undistorter = undistorter     # PointUndistorter for the poses (optional)
+
+        self.results = None                # cached detections
+        self.poses = {}                    # their poses, solved once per detection
+        self.found_by = {}                 # which pass found each cached tag
+        self.patches = []                  # (x1, y1, x2, y2, gray patch) per corner
+        self.since_detect = 0
+
+        # counters
+        self.frames_detected = 0
+        self.frames_cached = 0
+
+    def _corner_patches(self, gray, results):
+        h, w = gray.shape[:2]
+        k = self.patch_size
+        patches = []
+        for r in results:
+            for (px, py) in r.corners:
+                x1, y1 = max(int(px) - k, 0), max(int(py) - k, 0)
+                x2, y2 = min(int(px) + k + 1, w), min(int(py) + k + 1, h)
+                if x2 > x1 and y2 > y1:
+                    patches.append((x1, y1, x2, y2, gray[y1:y2, x1:x2].copy()))
+        return patches
+
+    def drifted(self, gray):
+        """True if any tag corner does not look like it did when we found it."""
+        for x1, y1, x2, y2, patch in self.patches:
+            if cv2.absdiff(gray[y1:y2, x1:x2], patch).mean() > self.drift_threshold:
+                return True
+        return False
+
+    def complete(self):
+        """True if the cached detection has every required tag."""
+        if not self.results:
+            return False
+        found = {r.tag_id for r in self.results}
+        return all(tag_id in found for tag_id in self.required_ids)
+
+    def detect(self, frame, camera_params, draw=True):
+        gray = to_gray(frame)
+
+        if (
+            not self.complete()
+            or self.since_detect >= self.redetect_every - 1
+            or self.drifted(gray)
+        ):
+            self.results, self.found_by = find_apriltags(gray, camera_params, self.config, with_found_by=True)
+            self.poses = poses_from_detections(self.results, camera_params, self.undistorter, self.found_by)
+            self.patches = self._corner_patches(gray, self.results)
+            self.since_detect = 0
+            self.frames_detected += 1
+        else:
+            self.since_detect += 1
+            self.frames_cached += 1
+
+        april_poses = dict(self.poses)
+        if draw:
+            draw_detections(frame, self.results)
+
+        found_tags = list(april_poses.keys())
+        return frame, april_poses, found_tags
+
+    def reset(self):
+        self.results = None
+        self.poses = {}
+        self.found_by = {}
+        self.patches = []
+        self.since_detect = 0
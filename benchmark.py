@@ -0,0 +1,236 @@
+"""
+How long every stage of the perception takes, on the same recorded frames.
+
+Stages (timed one by one on every frame):
+  tags      detect_apriltags (one pass at --quad-decimate)
+  predict   cards_model.predict
+  extract   reading the YOLO boxes into arrays (card_boxes)
+  pair      grouping + pairing the corners into cards (pair_cards)
+  draw      rendering the card overlay on a copy of the frame (card_overlay)
+  closest   assign_cards for the player and dealer tags (only frames where
+            tag 1 is seen), what take_a_pic does every frame
+
+Every combination of --imgsz / --iou / --max-det / --quad-decimate is one
+config. For every config and stage we report p50 / p95 / p99 latency (ms)
+and throughput (calls per second), and save everything to
+results/bench/bench_<time>.json. --compare old.json prints how the p50 of
+every stage changed.
+
+    python benchmark.py --frames results/recordings/table1 --imgsz 640 1280 --max-det 20 60
+    python benchmark.py --frames "results/photos/*.jpg" --compare results/bench/bench_old.json
+
+--frames is a folder made with FRAME_SOURCE=record:<folder> or a glob of images.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+BENCH_FOLDER = "results/bench"
+PLAYER_TAG = 1   # the table plane / depth tag, like make_the_magic.tag_id_for_depth
+DEALER_TAG = 0
+STAGES = ("tags", "predict", "extract", "pair", "draw", "closest")
+
+
+def load_frames(spec, limit=None):
+    """All frames of a recording folder (or an image glob), in memory."""
+    frames = []
+    if os.path.isdir(spec):
+        from frame_source import ReplaySource
+
+        source = ReplaySource(spec, realtime=False)
+        while limit is None or len(frames) < limit:
+            ret, frame = source.read()
+            if not ret:
+                break
+            # the replay reuses its buffers, we keep every frame
+            frames.append(frame.copy())
+        source.close()
+    else:
+        for path in sorted(glob.glob(spec)):
+            if limit is not None and len(frames) >= limit:
+                break
+            img = cv2.imread(path)
+            if img is None:
+                print(f"skip {path} (cant read)")
+                continue
+            frames.append(img)
+    return frames
+
+
+def summarize(samples_ms):
+    """p50 / p95 / p99 / mean in ms and calls per second of one stage."""
+    if not samples_ms:
+        return {"count": 0}
+    arr = np.array(samples_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    total = arr.sum()
+    return {
+        "count": int(arr.size),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(arr.mean()),
+        "throughput_per_s": float(arr.size / (total / 1000)) if total > 0 else None,
+    }
+
+
+def run_config(frames, config, warmup=1):
+    """Times every stage of one config over all frames. Returns {stage: summary}."""
+    import discover_cards_frames as dcf
+    from april_tags_frames import DetectionConfig, detect_apriltags
+    from calibration_profile import get_profile
+    from card_assignment import assign_cards
+    from table_plane import TablePlane
+
+    # not from make_the_magic: importing the game starts a run (run id,
+    # folders, log, metrics server, shared gate / tag cache)
+    camera_params = get_profile().camera_params
+
+    predict_args = dict(dcf.PREDICT_ARGS, imgsz=config["imgsz"], iou=config["iou"],
+                        max_det=config["max_det"])
+    tag_config = DetectionConfig("speed", coarse_decimate=config["quad_decimate"])
+
+    # first calls pay for model setup / memory allocation, dont count them
+    for frame in frames[:warmup]:
+        dcf.cards_model.predict(frame, **predict_args)
+        detect_apriltags(frame.copy(), camera_params, tag_config)
+
+    samples = {stage: [] for stage in STAGES}
+    found = []
+    timer = time.perf_counter
+
+    for frame in frames:
+        frame_for_tags = frame.copy()
+        start = timer()
+        _, april_poses, _ = detect_apriltags(frame_for_tags, camera_params, tag_config)
+        samples["tags"].append((timer() - start) * 1000)
+
+        start = timer()
+        res = dcf.cards_model.predict(frame, **predict_args)[0]
+        samples["predict"].append((timer() - start) * 1000)
+
+        start = timer()
+        boxes = dcf.card_boxes(res)
+        samples["extract"].append((timer() - start) * 1000)
+
+        start = timer()
+        card_poses, _ = dcf.pair_cards(boxes)
+        samples["pair"].append((timer() - start) * 1000)
+
+        start = timer()
+        dcf.card_overlay(boxes, card_poses).render(frame)
+        samples["draw"].append((timer() - start) * 1000)
+
+        found.append(len(card_poses))
+        plane = TablePlane.from_pose(april_poses.get(PLAYER_TAG), camera_params)
+        if plane is not None:
+            start = timer()
+            card_poses_3d = plane.cards_to_table(card_poses)
+            tag_poses_3d = plane.tags_to_table(april_poses)
+            assign_cards(card_poses_3d, tag_poses_3d, {PLAYER_TAG: 2, DEALER_TAG: 1}, list(card_poses))
+            samples["closest"].append((timer() - start) * 1000)
+
+    result = {stage: summarize(ms) for stage, ms in samples.items()}
+    result["cards_per_frame"] = float(np.mean(found)) if found else 0.0
+    return result
+
+
+def print_results(runs):
+    for run in runs:
+        c = run["config"]
+        print(f"\nimgsz={c['imgsz']} iou={c['iou']} max_det={c['max_det']} "
+              f"quad_decimate={c['quad_decimate']}  ({run['stages']['cards_per_frame']:.1f} cards/frame)")
+        print(f"  {'stage':<8} {'p50':>8} {'p95':>8} {'p99':>8} {'per s':>8}")
+        for stage in STAGES:
+            s = run["stages"][stage]
+            if not s["count"]:
+                print(f"  {stage:<8} {'-':>8}")
+                continue
+            print(f"  {stage:<8} {s['p50_ms']:8.2f} {s['p95_ms']:8.2f} {s['p99_ms']:8.2f} "
+                  f"{s['throughput_per_s']:8.1f}")
+
+
+def config_key(config):
+    return (config["imgsz"], config["iou"], config["max_det"], config["quad_decimate"])
+
+
+def compare(runs, old_path):
+    """Prints the p50 change of every stage against an older benchmark file."""
+    with open(old_path) as f:
+        old_runs = {config_key(r["config"]): r for r in json.load(f)["runs"]}
+
+    print(f"\ncompared to {old_path} (p50 ms, old -> new)")
+    for run in runs:
+        old = old_runs.get(config_key(run["config"]))
+        if old is None:
+            continue
+        print(f"  {config_key(run['config'])}")
+        for stage in STAGES:
+            a, b = old["stages"][stage], run["stages"][stage]
+            if not a.get("count") or not b.get("count"):
+                continue
+            change = (b["p50_ms"] - a["p50_ms"]) / a["p50_ms"] * 100 if a["p50_ms"] else 0.0
+            print(f"    {stage:<8} {a['p50_ms']:8.2f} -> {b['p50_ms']:8.2f}  ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="per stage latency of the card / tag perception")
+    parser.add_argument("--frames", required=True,
+                        help="recording folder (FRAME_SOURCE=record:<folder>) or glob of images")
+    parser.add_argument("--limit", type=int, default=None, help="use only the first N frames")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[1280])
+    parser.add_argument("--iou", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--max-det", type=int, nargs="+", default=[20])
+    parser.add_argument("--quad-decimate", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--warmup", type=int, default=1, help="untimed frames per config")
+    parser.add_argument("--out", default=None, help="json file (default results/bench/bench_<time>.json)")
+    parser.add_argument("--compare", default=None, help="older benchmark json to compare with")
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.frames, args.limit)
+    if not frames:
+        print(f"no frames in {args.frames}")
+        return 1
+    print(f"{len(frames)} frames from {args.frames}")
+
+    import discover_cards_frames
+
+    runs = []
+    for imgsz, iou, max_det, quad_decimate in itertools.product(
+        args.imgsz, args.iou, args.max_det, args.quad_decimate
+    ):
+        config = dict(imgsz=imgsz, iou=iou, max_det=max_det, quad_decimate=quad_decimate)
+        runs.append({"config": config, "stages": run_config(frames, config, args.warmup)})
+    print_results(runs)
+
+    out = args.out or os.path.join(BENCH_FOLDER, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    folder = os.path.dirname(out)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            "frames": args.frames,
+            "num_frames": len(frames),
+            "frame_size": list(frames[0].shape[:2]),
+            "backend": discover_cards_frames.cards_backend,
+            "machine": platform.platform(),
+            "cpus": os.cpu_count(),
+            "runs": runs,
+        }, f, indent=2)
+    print(f"\nsaved to {out}")
+
+    if args.compare:
+        compare(runs, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Camera calibration from a folder of chessboard photos, without the GUI loop.
+
+  - the corners of every image are found in a process pool
+  - first on a shrunk copy (fast), then refined with cornerSubPix on the
+    full image; only if the small search fails we search the full image
+  - the corners of every image are cached by the hash of the file, so after
+    adding a few photos only the new ones are processed
+
+    python caliberation/calibrate.py --images "caliberation/calib_images/*.jpg" --board 7 9 --square 20 --model fisheye
+    python caliberation/calibrate.py --board 10 7 --square 0.025 --model standard --profile camera
+
+--profile <name> saves the result as caliberation/profiles/<name>.json (see
+calibration_profile.py), which is what the game loads.
+"""
+import argparse
+import glob
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# so we can import the modules from the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from calibration_profile import save_profile
+
+CACHE_FOLDER = "results/corner_cache"
+
+criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+FIND_FLAGS = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_FAST_CHECK
+
+
+# ----------------------------------------------------
+# CORNERS (runs in the worker processes)
+# ----------------------------------------------------
+def find_corners(path, board, scale=0.5):
+    """
+    Chessboard corners of one image.
+    Returns (found, corners (N, 2) float32 or None, (w, h) of the image).
+    """
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return False, None, None
+    h, w = img.shape[:2]
+
+    corners = None
+    if scale < 1.0:
+        small = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        ret, small_corners = cv2.findChessboardCorners(small, board, FIND_FLAGS)
+        if ret:
+            corners = (small_corners / scale).astype(np.float32)
+    if corners is None:
+        # the board is too small in the shrunk image, try the real one
+        ret, corners = cv2.findChessboardCorners(img, board, FIND_FLAGS)
+        if not ret:
+            return False, None, (w, h)
+
+    # refine at full resolution, the window grows with how much we shrunk
+    win = max(5, int(round(5 / scale))) if scale < 1.0 else 11
+    corners = cv2.cornerSubPix(img, corners.reshape(-1, 1, 2), (win, win), (-1, -1), criteria)
+    return True, corners.reshape(-1, 2), (w, h)
+
+
+def file_key(path, board, scale):
+    """Hash of the file content + the search settings."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(f"{board[0]}x{board[1]}@{scale}".encode())
+    return h.hexdigest()
+
+
+def cached_corners(paths, board, scale=0.5, workers=None, cache_folder=CACHE_FOLDER):
+    """
+    {path: (found, corners, size)} for every image, new images are
+    processed in parallel, the rest comes from the cache.
+    """
+    os.makedirs(cache_folder, exist_ok=True)
+    results = {}
+    todo = []
+    for path in paths:
+        key = file_key(path, board, scale)
+        cache_path = os.path.join(cache_folder, key + ".npz")
+        if os.path.exists(cache_path):
+            data = np.load(cache_path)
+            found = bool(data["found"])
+            results[path] = (found, data["corners"] if found else None, tuple(data["size"]))
+        else:
+            todo.append((path, cache_path))
+
+    print(f"{len(paths)} images, {len(paths) - len(todo)} cached, {len(todo)} to process")
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(find_corners, path, board, scale) for path, _ in todo]
+            for (path, cache_path), job in zip(todo, jobs):
+                found, corners, size = job.result()
+                if size is None:
+                    print(f"skip {path} (cant read)")
+                    continue
+                np.savez(
+                    cache_path,
+                    found=found,
+                    corners=corners if found else np.zeros((0, 2), np.float32),
+                    size=np.array(size),
+                )
+                results[path] = (found, corners, size)
+                print(path, "ret =", found)
+    return results
+
+
+# ----------------------------------------------------
+# CALIBRATION
+# ----------------------------------------------------
+def board_points(board, square_size):
+    objp = np.zeros((board[0] * board[1], 3), np.float64)
+    objp[:, :2] = np.mgrid[0:board[0], 0:board[1]].T.reshape(-1, 2) * square_size
+    return objp
+
+
+def calibrate(corners_by_image, board, square_size, model="standard"):
+    """Returns (rms, K, D, (w, h)) from the found corners."""
+    found = [(c, size) for ok, c, size in corners_by_image.values() if ok]
+    if not found:
+        raise RuntimeError("No corners detected! Check images.")
+    sizes = {size for _, size in found}
+    if len(sizes) > 1:
+        raise RuntimeError(f"images have different sizes: {sorted(sizes)}")
+    size = sizes.pop()
+
+    objp = board_points(board, square_size)
+    if model == "fisheye":
+        objpoints = [objp.reshape(1, -1, 3) for _ in found]
+        imgpoints = [c.reshape(1, -1, 2).astype(np.float64) for c, _ in found]
+        rms, K, D, _, _ = cv2.fisheye.calibrate(
+            objpoints, imgpoints, size,
+            np.eye(3, dtype=np.float64), np.zeros((4, 1), dtype=np.float64),
+            flags=cv2.fisheye.CALIB_RECOMPUTE_EXTRINSIC +
+                  cv2.fisheye.CALIB_CHECK_COND +
+                  cv2.fisheye.CALIB_FIX_SKEW,
+            criteria=criteria,
+        )
+    else:
+        objpoints = [objp.astype(np.float32) for _ in found]
+        imgpoints = [c.reshape(-1, 1, 2).astype(np.float32) for c, _ in found]
+        rms, K, D, _, _ = cv2.calibrateCamera(objpoints, imgpoints, size, None, None)
+    return rms, K, D, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="calibrate the camera from chessboard photos")
+    parser.add_argument("--images", default="caliberation/calib_images/*.jpg")
+    parser.add_argument("--board", type=int, nargs=2, default=[7, 9], help="inner corners (cols rows)")
+    parser.add_argument("--square", type=float, default=20.0, help="size of one square (mm or m)")
+    parser.add_argument("--model", choices=["standard", "fisheye"], default="fisheye")
+    parser.add_argument("--scale", type=float, default=0.5, help="shrink for the first corner search")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--profile", default=None, help="save the result as this calibration profile")
+    args = parser.parse_args(argv)
+
+    images = sorted(glob.glob(args.images))
+    print("Found images:", len(images))
+    if not images:
+        return 1
+
+    board = tuple(args.board)
+    corners = cached_corners(images, board, args.scale, args.workers)
+    rms, K, D, size = calibrate(corners, board, args.square, args.model)
+
+    print("\n=== Calibration result ===")
+    print("images used:", sum(1 for ok, _, _ in corners.values() if ok))
+    print("RMS reprojection error:", rms)
+    print("K =\n", K)
+    print("D =\n", D)
+
+    if args.profile:
+        profile = save_profile(args.profile, K, D, size, model=args.model, rms=rms)
+        print("saved profile", profile.path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
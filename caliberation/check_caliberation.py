@@ -1,39 +1,26 @@
+import os
+import sys
+
 import cv2
 import numpy as np
 
-# === YOUR CALIBRATION RESULTS ===
-K = np.array([
-    [1553.12643,    0.      , 930.736239],
-    [   0.      , 1539.41589, 573.769916],
-    [   0.      ,    0.      ,   1.      ]
-], dtype=np.float64)
-
-D = np.array([
-    [  0.24397915],
-    [  1.73456832],
-    [-13.27475683],
-    [ 38.16459386]
-], dtype=np.float64)
+# so we can import the modules from the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from calibration_profile import get_profile
 
+# === YOUR CALIBRATION RESULTS ===
+# caliberation/profiles/fisheye.json, written by calibrate.py --model fisheye --profile fisheye
+profile = get_profile("fisheye")
+K = profile.K
+D = profile.D
 
-def undistort_fisheye(img):
-    h, w = img.shape[:2]
 
+def undistort_fisheye(img, balance=0.0):
     # You can play with "balance" (0 = more crop, 1 = keep FOV)
-    balance = 0.0
-    dim = (w, h)
-
-
-    newK = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(
-        K, D, dim, np.eye(3), balance=balance
-    )
-
-    map1, map2 = cv2.fisheye.initUndistortRectifyMap(
-        K, D, np.eye(3), newK, dim, cv2.CV_16SC2
-    )
-
-    undistorted = cv2.remap(img, map1, map2, interpolation=cv2.INTER_LINEAR)
-    return undistorted
+    # the profile keeps one Undistorter per image size, the maps are built (or loaded) only once
+    h, w = img.shape[:2]
+    und = profile.undistorter(balance, size=(w, h))
+    return und.undistort(img, dst=np.empty_like(img))
 
 
 if __name__ == "__main__":
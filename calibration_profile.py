@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from undistort import Undistorter, PointUndistorter, MAPS_FOLDER
+
+# ----------------------------------------------------
+# One place for the camera calibration.
+#
+# A profile is a small json file in caliberation/profiles/<name>.json:
+#   model   "standard" / "fisheye"
+#   size    [width, height] the calibration images had
+#   K, D    camera matrix and distortion coefficients
+#   K_inv   inverse of K (pixels -> rays), so nobody has to invert it again
+#   rms     reprojection error of the calibration (if known)
+# The undistortion maps are big, they are kept as .npy next to the other
+# maps (see undistort.py) and only loaded when someone asks for them.
+#
+# caliberation/calibrate.py --profile <name> writes a profile,
+# MAGIC_CALIBRATION=<name or path.json> picks which one get_profile() loads.
+# ----------------------------------------------------
+
+PROFILE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "caliberation", "profiles")
+DEFAULT_PROFILE = "camera"
+
+
+def profile_path(name):
+    """Path of a profile, name can be a profile name or a path to a .json file."""
+    if name.endswith(".json"):
+        return name
+    return os.path.join(PROFILE_FOLDER, name + ".json")
+
+
+class CalibrationProfile:
+    """
+    The calibration of one camera, plus everything we derive from it.
+
+    K, D   = camera matrix / distortion coefficients (numpy)
+    size   = (width, height)
+    model  = "standard" or "fisheye"
+
+    fx, fy, cx, cy and camera_params are plain floats, ready for the tag
+    detector. The Undistorter / PointUndistorter are made on first use and
+    kept, so all the modules share the same maps.
+    """
+
+    def __init__(self, K, D, size, model="standard", rms=None, K_inv=None, path=None):
+        if model not in ("standard", "fisheye"):
+            raise ValueError(f"unknown camera model {model}")
+        self.K = np.asarray(K, dtype=np.float64).reshape(3, 3)
+        self.D = np.asarray(D, dtype=np.float64).ravel()
+        self.size = (int(size[0]), int(size[1]))
+        self.model = model
+        self.rms = rms
+        self.K_inv = np.linalg.inv(self.K) if K_inv is None else np.asarray(K_inv, dtype=np.float64).reshape(3, 3)
+        self.path = path
+
+        self.fx = float(self.K[0, 0])
+        self.fy = float(self.K[1, 1])
+        self.cx = float(self.K[0, 2])
+        self.cy = float(self.K[1, 2])
+
+        self._undistorters = {}
+        self._point_undistorter = None
+        self.lock = threading.Lock()
+
+    @property
+    def camera_params(self):
+        """[fx, fy, cx, cy] of the raw (distorted) frames."""
+        return [self.fx, self.fy, self.cx, self.cy]
+
+    # ------------------------------------------------------
+    # derived, made once
+    # ------------------------------------------------------
+    def undistorter(self, balance=0.0, size=None, folder=MAPS_FOLDER):
+        """
+        The Undistorter for frames of `size` (default: the calibrated size).
+        The maps are built the first time and loaded from disk after that.
+        """
+        size = self.size if size is None else (int(size[0]), int(size[1]))
+        key = (size, float(balance))
+        with self.lock:
+            if key not in self._undistorters:
+                self._undistorters[key] = Undistorter(
+                    self.K, self.D, size, model=self.model, balance=balance, folder=folder
+                )
+            return self._undistorters[key]
+
+    def point_undistorter(self):
+        with self.lock:
+            if self._point_undistorter is None:
+                self._point_undistorter = PointUndistorter(self.K, self.D, model=self.model)
+            return self._point_undistorter
+
+    # ------------------------------------------------------
+    # file
+    # ------------------------------------------------------
+    def to_dict(self):
+        return {
+            "model": self.model,
+            "size": list(self.size),
+            "K": self.K.tolist(),
+            "D": self.D.tolist(),
+            "K_inv": self.K_inv.tolist(),
+            "rms": self.rms,
+        }
+
+    def save(self, path, build_maps=True):
+        """
+        Writes the profile to path. build_maps also makes the undistortion
+        maps now, so the first run with this profile does not wait for them.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        self.path = path
+        if build_maps:
+            self.undistorter()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            data["K"], data["D"], data["size"],
+            model=data.get("model", "standard"),
+            rms=data.get("rms"),
+            K_inv=data.get("K_inv"),
+            path=path,
+        )
+
+
+def save_profile(name, K, D, size, model="standard", rms=None, build_maps=True):
+    """Makes a profile from a calibration result and writes it. Returns the profile."""
+    profile = CalibrationProfile(K, D, size, model=model, rms=rms)
+    path = profile_path(name)
+    profile.save(path, build_maps=build_maps)
+    with _profiles_lock:
+        _profiles[os.path.abspath(path)] = profile
+    return profile
+
+
+# ----------------------------------------------------
+# loaded once per process
+# ----------------------------------------------------
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_profile(name=None):
+    """
+    The shared profile called `name` (a name in caliberation/profiles or a
+    .json path). name=None reads MAGIC_CALIBRATION, default "camera".
+    """
+    if name is None:
+        name = os.environ.get("MAGIC_CALIBRATION", DEFAULT_PROFILE)
+    path = os.path.abspath(profile_path(name))
+    with _profiles_lock:
+        if path not in _profiles:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"no calibration profile {path}, run caliberation/calibrate.py --profile")
+            _profiles[path] = CalibrationProfile.load(path)
+        return _profiles[path]
@@ -0,0 +1,201 @@
+import atexit
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class CameraSession:
+    """
+    Long-lived camera capture.
+
+    A background thread keeps grabbing frames from the camera into a small
+    ring of buffer_size frames, so old frames fall out automatically.
+    read() always hands back the newest frame that the caller has not seen yet,
+    so we never process stale frames and never pay for reopening the camera.
+
+    Has the same read() / isOpened() / release() shape as cv2.VideoCapture
+    so it can be dropped in where a `cap` was used.
+
+    The frame arrays are reused: the camera writes into buffers that are
+    free again, so once running no new frame is allocated. The last `keep`
+    frames you got from read() stay untouched, older ones go back to the
+    camera. Copy a frame if you need it longer (reserve(n) makes `keep`
+    bigger).
+    """
+
+    def __init__(self, src=0, api=cv2.CAP_DSHOW, width=None, height=None,
+                 buffer_size=2, read_timeout=2.0, keep=4):
+        self.src = src
+        self.api = api
+        self.width = width
+        self.height = height
+        self.read_timeout = read_timeout
+
+        self.buffer_size = buffer_size
+        self.keep = keep
+        self.frames = deque()    # (seq, frame) not read yet, newest on the right
+        self.leased = deque()    # frames given to the consumer, still in use
+        self.free = []           # buffers the camera can write into
+        self.cond = threading.Condition()
+        self.seq = 0           # id of the newest grabbed frame
+        self.last_read = 0     # id of the last frame given to the consumer
+        self.frames_dropped = 0
+        self.running = False
+        self.cap = None
+        self.thread = None
+
+    # ------------------------------------------------------
+    # open the camera and start the grabber thread
+    # ------------------------------------------------------
+    def start(self):
+        if self.running:
+            return self
+
+        if self.api is None:
+            self.cap = cv2.VideoCapture(self.src)
+        else:
+            self.cap = cv2.VideoCapture(self.src, self.api)
+        if not self.cap.isOpened():
+            raise Exception("Could not open camera.")
+
+        if self.width is not None:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height is not None:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+
+        self.running = True
+        self.thread = threading.Thread(target=self._grab_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def _grab_loop(self):
+        while self.running:
+            with self.cond:
+                buf = self.free.pop() if self.free else None
+
+            # read straight into a free buffer (a new one only while warming up)
+            if buf is not None:
+                ret, frame = self.cap.read(buf)
+            else:
+                ret, frame = self.cap.read()
+            if not ret:
+                if buf is not None:
+                    with self.cond:
+                        self.free.append(buf)
+                # camera hiccup, dont spin the cpu
+                time.sleep(0.01)
+                continue
+
+            with self.cond:
+                if len(self.frames) >= self.buffer_size:
+                    # the oldest frame was never read and falls out
+                    _, old = self.frames.popleft()
+                    self.free.append(old)
+                    self.frames_dropped += 1
+                self.seq += 1
+                self.frames.append((self.seq, frame))
+                self.cond.notify_all()
+
+    # ------------------------------------------------------
+    # consumer side
+    # ------------------------------------------------------
+    def isOpened(self):
+        return self.running and self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        """
+        Returns (ret, frame) like cv2.VideoCapture.read(),
+        but always the newest frame and never the same frame twice.
+        """
+        if not self.running:
+            self.start()
+
+        with self.cond:
+            got_new = self.cond.wait_for(
+                lambda: self.seq > self.last_read or not self.running,
+                timeout=self.read_timeout,
+            )
+            if not got_new or not self.frames:
+                return False, None
+
+            seq, frame = self.frames.pop()
+            self.last_read = seq
+            # older frames were skipped, their buffers can be reused
+            while self.frames:
+                self.free.append(self.frames.popleft()[1])
+            self.leased.append(frame)
+            while len(self.leased) > self.keep:
+                self.free.append(self.leased.popleft())
+            return True, frame
+
+    def unread(self, frame):
+        """
+        Gives back a frame from read() that was never used (e.g. read
+        ahead). By the next read() the camera has newer frames, so it is
+        not served again, its buffer just goes back to the camera.
+        """
+        with self.cond:
+            for i, leased in enumerate(self.leased):
+                if leased is frame:
+                    del self.leased[i]
+                    self.free.append(frame)
+                    break
+
+    def reserve(self, keep):
+        """Keep at least the last `keep` frames from read() untouched."""
+        with self.cond:
+            self.keep = max(self.keep, keep)
+
+    def release(self):
+        """
+        Shared sessions stay open between calls, so this does nothing.
+        Use close() to really stop the camera.
+        """
+        pass
+
+    def close(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        self.frames.clear()
+        self.leased.clear()
+        self.free.clear()
+
+
+# ----------------------------------------------------
+# one session per camera, shared by everyone in the process
+# ----------------------------------------------------
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_camera_session(src=0, api=cv2.CAP_DSHOW, width=None, height=None):
+    """
+    Returns the shared (already started) session for this camera.
+    The first caller opens it, everyone after that reuses it.
+    """
+    with _sessions_lock:
+        session = _sessions.get(src)
+        if session is None or not session.running:
+            session = CameraSession(src, api, width=width, height=height)
+            session.start()
+            _sessions[src] = session
+        return session
+
+
+def close_all_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+atexit.register(close_all_sessions)
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+def distance_matrix(card_xyz, tag_xyz):
+    """
+    (N, 3) cards x (M, 3) tags -> (N, M) distances on the table (x, y only,
+    like make_the_magic.distance).
+    """
+    card_xy = np.asarray(card_xyz, dtype=np.float64).reshape(-1, 3)[:, :2]
+    tag_xy = np.asarray(tag_xyz, dtype=np.float64).reshape(-1, 3)[:, :2]
+    diff = card_xy[:, None, :] - tag_xy[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=2))
+
+
+class CardAssignment:
+    """
+    Which cards belong to which tag (player = tag 1, dealer = tag 0 ...).
+
+    labels   = the card labels, rows of dist
+    tag_ids  = the tag ids, columns of dist
+    dist     = (N, M) card x tag distances
+    picks    = {tag_id: row indices of its cards, closest first}
+
+    cards(tag_id) / distances(tag_id) / as_dict() give the same lists and
+    dicts the old loops did.
+    """
+
+    def __init__(self, labels, tag_ids, dist, picks):
+        self.labels = labels
+        self.tag_ids = tag_ids
+        self.dist = dist
+        self.picks = picks
+
+    def cards(self, tag_id):
+        return [self.labels[i] for i in self.picks.get(tag_id, ())]
+
+    def distances(self, tag_id):
+        if tag_id not in self.picks:
+            return []
+        return self.dist[self.picks[tag_id], self.tag_ids.index(tag_id)].tolist()
+
+    def as_dict(self):
+        """{card: {tag_id: distance}} for every card and tag."""
+        return {
+            label: dict(zip(self.tag_ids, row))
+            for label, row in zip(self.labels, self.dist.tolist())
+        }
+
+
+def assign_cards(card_poses, tag_poses, wanted, labels=None, exclusive=True):
+    """
+    card_poses[label] = [x, y, z], tag_poses[tag_id] = [x, y, z] (same frame)
+    wanted    = {tag_id: how many cards}, e.g. {1: 2, 0: 1}
+    labels    = the cards to consider (default: all of card_poses)
+    exclusive = a card goes to one tag only: the closest (card, tag) pairs
+                are handed out first, so when player and dealer both want
+                the same card the nearer one gets it and the other takes
+                its next closest card.
+                False = every tag just takes its k nearest cards.
+
+    One distance matrix for everything, argpartition for the k nearest.
+    """
+    if labels is None:
+        labels = list(card_poses)
+    labels = [label for label in labels if label in card_poses]
+    tag_ids = [tag_id for tag_id in tag_poses if tag_poses[tag_id] is not None]
+
+    if labels and tag_ids:
+        dist = distance_matrix([card_poses[label] for label in labels],
+                               [tag_poses[tag_id] for tag_id in tag_ids])
+    else:
+        dist = np.zeros((len(labels), len(tag_ids)))
+
+    wanted = {tag_id: min(k, len(labels)) for tag_id, k in wanted.items() if tag_id in tag_ids}
+    if exclusive and len(wanted) > 1:
+        picks = _exclusive(dist, tag_ids, wanted)
+    else:
+        picks = {tag_id: _nearest(dist[:, tag_ids.index(tag_id)], k) for tag_id, k in wanted.items()}
+    return CardAssignment(labels, tag_ids, dist, picks)
+
+
+def _nearest(column, k):
+    """Row indices of the k smallest values, closest first (ties: lower row first)."""
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    if k < len(column):
+        idx = np.argpartition(column, k - 1)[:k]
+    else:
+        idx = np.arange(len(column))
+    return idx[np.lexsort((idx, column[idx]))]
+
+
+def _exclusive(dist, tag_ids, wanted):
+    # every tag can only lose cards to the others, so it never needs more
+    # than all the wanted cards together: only those candidates get sorted
+    total = sum(wanted.values())
+    cols = [tag_ids.index(tag_id) for tag_id in wanted]
+    cand_rows = []
+    cand_cols = []
+    for col in cols:
+        rows = _nearest(dist[:, col], min(total, dist.shape[0]))
+        cand_rows.append(rows)
+        cand_cols.append(np.full(len(rows), col))
+    rows = np.concatenate(cand_rows)
+    cols_flat = np.concatenate(cand_cols)
+    order = np.argsort(dist[rows, cols_flat], kind="stable")
+
+    need = dict(wanted)
+    taken = set()
+    picks = {tag_id: [] for tag_id in wanted}
+    left = total
+    for i in order:
+        row, tag_id = rows[i], tag_ids[cols_flat[i]]
+        if row in taken or need[tag_id] == 0:
+            continue
+        taken.add(row)
+        picks[tag_id].append(row)
+        need[tag_id] -= 1
+        left -= 1
+        if left == 0:
+            break
+    return {tag_id: np.array(picked, dtype=np.intp) for tag_id, picked in picks.items()}
@@ -0,0 +1,173 @@
+"""
+Which engine runs the card model.
+
+  torch          the original yolov8s_playing_cards.pt (PyTorch, eager)
+  onnx           exported ONNX graph, runs on ONNX Runtime
+  onnx-int8      the ONNX graph with INT8 weights (dynamic quantisation)
+  openvino       exported OpenVINO graph (fastest on intel CPUs)
+  openvino-int8  OpenVINO graph quantised to INT8 (needs calibration images)
+
+All of them are loaded through ultralytics YOLO, so predict() and the boxes
+we get back look the same and discover_cards does not care which one runs.
+
+Pick one with the CARDS_BACKEND environment variable or
+discover_cards_frames.set_cards_backend(name).
+
+One-shot export + check against the torch model:
+    python card_backends.py export onnx --images "results/photos/*.jpg"
+    python card_backends.py verify openvino --images "results/photos/*.jpg"
+"""
+import argparse
+import glob
+import os
+import sys
+
+from ultralytics import YOLO
+
+TORCH_WEIGHTS = "yolov8s_playing_cards.pt"
+EXPORT_IMGSZ = 1280
+
+BACKENDS = {
+    "torch": TORCH_WEIGHTS,
+    "onnx": "yolov8s_playing_cards.onnx",
+    "onnx-int8": "yolov8s_playing_cards_int8.onnx",
+    "openvino": "yolov8s_playing_cards_openvino_model",
+    "openvino-int8": "yolov8s_playing_cards_int8_openvino_model",
+}
+
+
+def load_cards_model(backend="torch"):
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend}, use one of {list(BACKENDS)}")
+    path = BACKENDS[backend]
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found, run: python card_backends.py export {backend}"
+        )
+    return YOLO(path, task="detect")
+
+
+# ----------------------------------------------------
+# EXPORT
+# ----------------------------------------------------
+def export_backend(backend, data=None):
+    """
+    Exports the torch model to `backend` and returns the exported path.
+    data = dataset yaml with calibration images (only for openvino-int8)
+    """
+    if backend == "torch":
+        return TORCH_WEIGHTS
+
+    model = YOLO(TORCH_WEIGHTS)
+
+    if backend == "onnx":
+        # dynamic so batches and the smaller ROI crops work too
+        return model.export(format="onnx", imgsz=EXPORT_IMGSZ, dynamic=True)
+
+    if backend == "onnx-int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        if not os.path.exists(BACKENDS["onnx"]):
+            export_backend("onnx")
+        quantize_dynamic(BACKENDS["onnx"], BACKENDS["onnx-int8"], weight_type=QuantType.QUInt8)
+        return BACKENDS["onnx-int8"]
+
+    if backend == "openvino":
+        return model.export(format="openvino", imgsz=EXPORT_IMGSZ, dynamic=True)
+
+    if backend == "openvino-int8":
+        if data is None:
+            raise ValueError("openvino-int8 needs --data (dataset yaml for calibration)")
+        # dynamic like the others, the calibration images still go in at EXPORT_IMGSZ
+        return model.export(format="openvino", imgsz=EXPORT_IMGSZ, dynamic=True, int8=True, data=data)
+
+    raise ValueError(f"unknown backend {backend}")
+
+
+# ----------------------------------------------------
+# VERIFY: same cards as the torch model?
+# ----------------------------------------------------
+def compare_cards(reference, candidate, iou_threshold=0.5, conf_tolerance=0.1):
+    """
+    Every card the torch model found must be found by the other backend too:
+    same label, boxes overlapping by iou_threshold, confidence within
+    conf_tolerance. Returns (matched, total).
+    """
+    from discover_cards_frames import box_iou
+
+    matched = 0
+    unused = list(candidate)
+    for ref in reference:
+        for cand in unused:
+            if (
+                cand["label"] == ref["label"]
+                and box_iou(cand["edges"], ref["edges"]) >= iou_threshold
+                and abs(cand["confidence"] - ref["confidence"]) <= conf_tolerance
+            ):
+                matched += 1
+                unused.remove(cand)
+                break
+    return matched, len(reference)
+
+
+def verify_backend(backend, images, iou_threshold=0.5, conf_tolerance=0.1, min_match=0.95):
+    """
+    Runs the torch model and `backend` on the same images and checks the
+    detections agree. Returns True if at least min_match of the torch cards
+    were matched.
+    """
+    import cv2
+    from discover_cards_frames import PREDICT_ARGS, extract_cards
+
+    reference_model = YOLO(TORCH_WEIGHTS)
+    candidate_model = load_cards_model(backend)
+
+    matched_all, total_all = 0, 0
+    for path in images:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"skip {path} (cant read)")
+            continue
+        ref = extract_cards(reference_model.predict(img, **PREDICT_ARGS)[0])
+        cand = extract_cards(candidate_model.predict(img, **PREDICT_ARGS)[0])
+        matched, total = compare_cards(ref, cand, iou_threshold, conf_tolerance)
+        matched_all += matched
+        total_all += total
+        print(f"{path}: {matched}/{total} cards match")
+
+    if total_all == 0:
+        print("no cards found by the torch model, nothing to compare")
+        return False
+
+    ratio = matched_all / total_all
+    print(f"{backend}: {matched_all}/{total_all} ({ratio:.1%}) match the torch model")
+    return ratio >= min_match
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="export / verify card model backends")
+    parser.add_argument("command", choices=["export", "verify"])
+    parser.add_argument("backend", choices=list(BACKENDS))
+    parser.add_argument("--images", default="results/photos/*.jpg",
+                        help="glob of frames to compare on")
+    parser.add_argument("--data", default=None,
+                        help="dataset yaml with calibration images (openvino-int8)")
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--conf-tol", type=float, default=0.1)
+    parser.add_argument("--min-match", type=float, default=0.95)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print("exported to", export_backend(args.backend, args.data))
+
+    images = sorted(glob.glob(args.images))
+    if not images:
+        print(f"no images match {args.images}, skipping the check")
+        return 0
+
+    ok = verify_backend(args.backend, images, args.iou, args.conf_tol, args.min_match)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import math
+from collections import Counter, deque
+
+import cv2
+import numpy as np
+
+import drawimages
+from drawimages import Overlay
+
+
+class Track:
+    """
+    One card we are following between frames.
+
+    Only the last `window` labels YOLO gave it vote, so when a new card is
+    dealt on the same spot the track switches to it after a few detections
+    instead of waiting until the new label out-votes the whole old card.
+    """
+
+    def __init__(self, label, point, conf=1.0, window=5):
+        self.recent = deque([label], maxlen=window)   # last labels of the detections
+        self.label = label
+        self.point = point              # [x, y] in the image
+        self.conf = conf                # YOLO confidence at the last detection
+        self.misses = 0                 # detections in a row that missed it
+
+    @property
+    def votes(self):
+        """label -> how many of the recent detections said so."""
+        return Counter(self.recent)
+
+    def vote(self, label):
+        self.recent.append(label)
+        votes = self.votes
+        best = max(votes.values())
+        # a tie keeps the label we have, one misread does not flip the card
+        if votes[self.label] < best:
+            self.label = next(l for l in reversed(self.recent) if votes[l] == best)
+
+
+class CardTracker:
+    """
+    Follows the cards between YOLO runs so we dont need YOLO on every frame.
+
+    Full detection (discover_cards) runs every `detect_every` frames.
+    In between, every card point is moved with optical flow (Lucas-Kanade).
+    If too many points get lost (tracking confidence below
+    `min_confidence`) we run the detection right away.
+
+    Detections are matched to the existing tracks by label first and then by
+    distance (centroid), and every track keeps a vote per label over its
+    last detections, so one frame where YOLO reads "8H" as "6H" does not
+    change the card.
+
+    detect_every   = run YOLO every N frames
+    min_confidence = part (0-1) of the points that must track well
+    max_distance   = pixels a card can move between detections and still
+                     count as the same card
+    max_misses     = drop a track after this many detections without it
+    vote_window    = how many recent detections vote for the label of a track
+
+    Call reset() when a new hand is dealt, the old tracks are about the old
+    cards.
+    """
+
+    def __init__(self, detect_every=5, min_confidence=0.6, max_distance=80, max_misses=2,
+                 vote_window=5):
+        self.detect_every = detect_every
+        self.min_confidence = min_confidence
+        self.max_distance = max_distance
+        self.max_misses = max_misses
+        self.vote_window = vote_window
+
+        self.tracks = []
+        self.prev_gray = None
+        self.since_detect = 0
+        self.confidence = 1.0
+
+        # counters
+        self.frames_detected = 0
+        self.frames_tracked = 0
+
+    # ------------------------------------------------------
+    # main entry: one call per frame
+    # ------------------------------------------------------
+    def update(self, frame, detect, with_confidence=False):
+        """
+        frame  = the new camera frame
+        detect = function(frame) -> (annotated, card_poses, found_cards),
+                 usually a discover_cards call. If it also returns
+                 card_confs (with_confidence=True) the tracks keep them.
+
+        Returns (annotated, card_poses, found_cards) like discover_cards,
+        plus card_confs when with_confidence=True.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        need_detect = (
+            not self.tracks
+            or self.prev_gray is None
+            or self.since_detect >= self.detect_every - 1
+        )
+        if not need_detect:
+            self.confidence = self._follow(gray)
+            # tracking got bad, dont wait for the next planned detection
+            need_detect = self.confidence < self.min_confidence
+
+        if need_detect:
+            result = detect(frame)
+            annotated, card_poses = result[0], result[1]
+            card_confs = result[3] if len(result) > 3 else {}
+            self._associate(card_poses, card_confs)
+            self.since_detect = 0
+            self.confidence = 1.0
+            self.frames_detected += 1
+        else:
+            annotated = self._draw(frame)
+            self.since_detect += 1
+            self.frames_tracked += 1
+
+        self.prev_gray = gray
+        best = self._best_tracks()
+        card_poses = {label: list(track.point) for label, track in best.items()}
+        if with_confidence:
+            card_confs = {label: track.conf for label, track in best.items()}
+            return annotated, card_poses, list(card_poses.keys()), card_confs
+        return annotated, card_poses, list(card_poses.keys())
+
+    def card_poses(self):
+        """card_poses[label] = [x, y] for every live track."""
+        return {label: list(track.point) for label, track in self._best_tracks().items()}
+
+    def _best_tracks(self):
+        best = {}
+        for track in self.tracks:
+            label = track.label
+            # two tracks with the same label: keep the one we trust more
+            if label not in best or track.votes[label] > best[label].votes[label]:
+                best[label] = track
+        return best
+
+    def reset(self):
+        self.tracks = []
+        self.prev_gray = None
+        self.since_detect = 0
+        self.confidence = 1.0
+
+    # ------------------------------------------------------
+    # optical flow between two frames
+    # ------------------------------------------------------
+    def _follow(self, gray):
+        """Moves every track with optical flow, returns the part that tracked well."""
+        pts = np.float32([t.point for t in self.tracks]).reshape(-1, 1, 2)
+
+        new_pts, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, pts, None, winSize=(21, 21), maxLevel=3
+        )
+        # track back to the old frame, a good point should land where it started
+        back_pts, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            gray, self.prev_gray, new_pts, None, winSize=(21, 21), maxLevel=3
+        )
+        fb_error = np.linalg.norm((back_pts - pts).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < 1.0)
+
+        for track, point, ok in zip(self.tracks, new_pts.reshape(-1, 2), good):
+            if ok:
+                track.point = [float(point[0]), float(point[1])]
+
+        return float(good.mean()) if len(good) else 0.0
+
+    # ------------------------------------------------------
+    # match a new detection to the tracks
+    # ------------------------------------------------------
+    def _associate(self, card_poses, card_confs):
+        unmatched_tracks = list(self.tracks)
+        unmatched_cards = dict(card_poses)
+
+        # 1) same label and close enough
+        for track in list(unmatched_tracks):
+            label = track.label
+            if label in unmatched_cards and self._dist(track.point, unmatched_cards[label]) < self.max_distance:
+                self._hit(track, label, unmatched_cards.pop(label), card_confs.get(label, 1.0))
+                unmatched_tracks.remove(track)
+
+        # 2) different label but same place (YOLO changed its mind)
+        for label, point in list(unmatched_cards.items()):
+            if not unmatched_tracks:
+                break
+            closest = min(unmatched_tracks, key=lambda t: self._dist(t.point, point))
+            if self._dist(closest.point, point) < self.max_distance:
+                self._hit(closest, label, unmatched_cards.pop(label), card_confs.get(label, 1.0))
+                unmatched_tracks.remove(closest)
+
+        # 3) tracks nobody saw this time
+        for track in unmatched_tracks:
+            track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        # 4) new cards
+        for label, point in unmatched_cards.items():
+            self.tracks.append(Track(label, list(point), card_confs.get(label, 1.0), self.vote_window))
+
+    @staticmethod
+    def _hit(track, label, point, conf):
+        track.vote(label)
+        track.point = list(point)
+        track.conf = conf
+        track.misses = 0
+
+    @staticmethod
+    def _dist(a, b):
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+
+    def _draw(self, frame):
+        if drawimages.headless:
+            return frame
+        overlay = Overlay()
+        for label, (x, y) in self.card_poses().items():
+            overlay.card(x, y, label, (0, 255, 255))   # yellow = tracked
+        return overlay.render(frame, reuse=True)
+
+    def stats(self):
+        return {
+            "frames_detected": self.frames_detected,
+            "frames_tracked": self.frames_tracked,
+            "tracks": len(self.tracks),
+            "confidence": self.confidence,
+        }
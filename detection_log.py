@@ -0,0 +1,199 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class DetectionLog:
+    """
+    One append-only file per run: results/logs/run_{RUN_ID}.jsonl
+
+    Every line is one frame:
+      {"frame": 12, "t": 1700000000.1,
+       "boxes": [[x1, y1, x2, y2], ...], "labels": [...], "confs": [...],
+       "pairs": {"8H": [x, y], ...},
+       "tags": {"1": [x, y, z], ...},
+       "tag_found_by": {"1": 2.0, ...},   (quad_decimate that found the tag)
+       "timing": {"tags_ms": 8.1, "cards_ms": 95.2}}
+
+    Different parts of the code know different parts of a frame (the card
+    detector knows the boxes, the caller knows the tags), so add() collects
+    fields for a frame and commit() writes the line. Frames nobody commits
+    are written anyway once more than `max_pending` frames wait, and on
+    close().
+
+    load_run() reads a whole run back into NumPy arrays.
+    """
+
+    def __init__(self, path, max_pending=16):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.max_pending = max_pending
+        self.file = open(path, "a", buffering=1 << 16)
+        self.pending = OrderedDict()     # frame_id -> record being filled
+        self.lock = threading.Lock()
+        self.frames_written = 0
+
+    def add(self, frame_id, **fields):
+        with self.lock:
+            record = self.pending.get(frame_id)
+            if record is None:
+                record = {"frame": frame_id, "t": time.time()}
+                self.pending[frame_id] = record
+            for key, value in fields.items():
+                if key == "timing" and "timing" in record:
+                    record["timing"].update(value)
+                else:
+                    record[key] = value
+
+            # nobody is committing these, dont keep them forever
+            while len(self.pending) > self.max_pending:
+                _, old = self.pending.popitem(last=False)
+                self._write(old)
+
+    def commit(self, frame_id, **fields):
+        if fields:
+            self.add(frame_id, **fields)
+        with self.lock:
+            record = self.pending.pop(frame_id, None)
+            if record is not None:
+                self._write(record)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, default=_to_json) + "\n")
+        self.frames_written += 1
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            while self.pending:
+                _, record = self.pending.popitem(last=False)
+                self._write(record)
+            if not self.file.closed:
+                self.file.close()
+
+
+def _to_json(value):
+    # numpy numbers / arrays that sneak into a record
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"cant log {type(value)}")
+
+
+# ----------------------------------------------------
+# one log per run, shared by everyone in the process
+# ----------------------------------------------------
+LOG_FOLDER = "results/logs"
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def run_log_path(run_id, folder=LOG_FOLDER):
+    return os.path.join(folder, f"run_{run_id}.jsonl")
+
+
+def get_detection_log(run_id, folder=LOG_FOLDER):
+    with _logs_lock:
+        log = _logs.get(run_id)
+        if log is None:
+            log = DetectionLog(run_log_path(run_id, folder))
+            _logs[run_id] = log
+        return log
+
+
+def close_detection_logs():
+    with _logs_lock:
+        for log in _logs.values():
+            log.close()
+        _logs.clear()
+
+
+atexit.register(close_detection_logs)
+
+
+# ----------------------------------------------------
+# READER
+# ----------------------------------------------------
+def load_run(path_or_run_id, folder=LOG_FOLDER):
+    """
+    Loads a whole run into flat NumPy arrays.
+
+    Per frame (F frames):
+      frame (F,), t (F,), timing[name] (F,) (nan where missing)
+    Per box (B boxes), box_frame = index of the frame (0..F-1):
+      box_frame (B,), boxes (B, 4), labels (B,), confs (B,)
+    Per paired card (P):
+      pair_frame (P,), pair_labels (P,), pair_xy (P, 2)
+    Per tag (T):
+      tag_frame (T,), tag_ids (T,), tag_xyz (T, 3) (nan if the pose failed),
+      tag_found_by (T,) (nan if not logged)
+    """
+    path = path_or_run_id
+    if not isinstance(path, str) or not os.path.exists(path):
+        path = run_log_path(path_or_run_id, folder)
+
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+
+    frame, t = [], []
+    box_frame, boxes, labels, confs = [], [], [], []
+    pair_frame, pair_labels, pair_xy = [], [], []
+    tag_frame, tag_ids, tag_xyz, tag_found_by = [], [], [], []
+    timing_names = sorted({name for r in records for name in r.get("timing", {})})
+    timing = {name: [] for name in timing_names}
+
+    for i, r in enumerate(records):
+        frame.append(r["frame"])
+        t.append(r["t"])
+        for name in timing_names:
+            timing[name].append(r.get("timing", {}).get(name, np.nan))
+
+        for box, label, conf in zip(r.get("boxes", []), r.get("labels", []), r.get("confs", [])):
+            box_frame.append(i)
+            boxes.append(box)
+            labels.append(label)
+            confs.append(conf)
+
+        for label, xy in r.get("pairs", {}).items():
+            pair_frame.append(i)
+            pair_labels.append(label)
+            pair_xy.append(xy)
+
+        found_by = r.get("tag_found_by", {})
+        for tag_id, xyz in r.get("tags", {}).items():
+            tag_frame.append(i)
+            tag_ids.append(int(tag_id))
+            tag_xyz.append(xyz if xyz is not None else [np.nan] * 3)
+            tag_found_by.append(found_by.get(tag_id, np.nan))
+
+    return {
+        "frame": np.array(frame, dtype=np.int64),
+        "t": np.array(t, dtype=np.float64),
+        "timing": {name: np.array(v, dtype=np.float64) for name, v in timing.items()},
+        "box_frame": np.array(box_frame, dtype=np.int64),
+        "boxes": np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        "labels": np.array(labels, dtype=str),
+        "confs": np.array(confs, dtype=np.float32),
+        "pair_frame": np.array(pair_frame, dtype=np.int64),
+        "pair_labels": np.array(pair_labels, dtype=str),
+        "pair_xy": np.array(pair_xy, dtype=np.float32).reshape(-1, 2),
+        "tag_frame": np.array(tag_frame, dtype=np.int64),
+        "tag_ids": np.array(tag_ids, dtype=np.int64),
+        "tag_xyz": np.array(tag_xyz, dtype=np.float64).reshape(-1, 3),
+        "tag_found_by": np.array(tag_found_by, dtype=np.float64),
+    }
@@ -1,17 +1,44 @@
 import cv2
 import os
 import time
-from ultralytics import YOLO
 from collections import defaultdict
-from drawimages import DrawImages
-cards_model = YOLO("yolov8s_playing_cards.pt")
+import drawimages
+from drawimages import Overlay
+from card_backends import load_cards_model
+from output_writer import get_output_writer
+from detection_log import get_detection_log
 import math
+import numpy as np
 
-def found_card(data):
-    stats=data[0]["confidence"]**2 + data[1]["confidence"]**2
-    if (stats>1):
-        return True
-    return False
+# torch / onnx / onnx-int8 / openvino / openvino-int8 (see card_backends.py)
+cards_backend = os.environ.get("CARDS_BACKEND", "torch")
+cards_model = load_cards_model(cards_backend)
+
+
+def set_cards_backend(backend):
+    """Switch the engine that runs the card model, at runtime."""
+    global cards_model, cards_backend
+    cards_model = load_cards_model(backend)
+    cards_backend = backend
+
+
+# where every frame's detections are recorded (see detection_log.py).
+# None = only frames with save_outputs=True are logged, to the run's log
+detection_log = None
+
+
+def set_detection_log(log):
+    """Record every frame to `log` (a DetectionLog), None to stop."""
+    global detection_log
+    detection_log = log
+
+
+def active_log(RUN_ID, save_outputs):
+    if detection_log is not None:
+        return detection_log
+    if save_outputs:
+        return get_detection_log(RUN_ID)
+    return None
 
 def center_of_one(data):
     top_left = (data[0]["edges"][0],data[0]["edges"][1])
@@ -22,133 +49,329 @@ def center_of_one(data):
 
 
 
-def discover_cards(frame, output_id, RUN_ID, save_outputs=False):
+# YOLO settings, the same for single frames and batches
+PREDICT_ARGS = dict(
+    iou=0.5,
+    imgsz=1280,
+    max_det=20,
+    half=False,
+    augment=False,  #change to True if it makes bugs. should teohreticly make the image proccesing better
+    verbose=False
+)
+
+
+def discover_cards(frame, output_id, RUN_ID, save_outputs=False, with_confidence=False):
     """
     Runs YOLO on a single frame (numpy array), finds cards,
     computes per-card positions, and optionally saves results.
 
     card_poses[label] = [x, y]  (image coordinates)
     found_cards = list(card_poses.keys())
+
+    with_confidence=True adds a 4th value:
+    card_confs[label] = YOLO confidence of the card (0-1)
     """
 
-    # work on a copy so we can draw
-    img = frame.copy()
+    # YOLO detection
+    results = cards_model.predict(frame, **PREDICT_ARGS)
+    return process_result(frame, results[0], output_id, RUN_ID, save_outputs, with_confidence)
 
-    # -------------------------------
-    # NEW: store drawing until after detection
-    # -------------------------------
-    drawing_ops = []   # list of functions that draw AFTER all cards are found
 
-    # YOLO detection
-    results = cards_model.predict(
-        img,
-        iou=0.5,
-        imgsz=1280,
-        max_det=20,
-        half=False,
-        augment=False,  #change to True if it makes bugs. should teohreticly make the image proccesing better
-        verbose=False
-    )
-    res = results[0]
-    cards = []
-
-    # Extract card data
-    for box in res.boxes:
-        cls_id = int(box.cls)
-        conf = float(box.conf)
-        label = res.names[cls_id]
-        x1, y1, x2, y2 = box.xyxy[0].tolist()
-        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-        cards.append({
-            "label": label,
-            "confidence": conf,
-            "edges": (x1, y1, x2, y2),
-            "center": (cx, cy)
-        })
-
-        # ---------------------------------------------------------------
-        # INSTEAD OF DRAWING NOW, SAVE A DRAWING TASK FOR LATER
-        # Draw card center + label (red)
-        # ---------------------------------------------------------------
-        drawing_ops.append(
-            DrawImages(cx, cy, label, (0, 0, 255), box=(x1, y1, x2, y2)).draw_card
+def discover_cards_batch(frames, output_ids, RUN_ID, save_outputs=False, with_confidence=False):
+    """
+    Same as discover_cards but for a list of frames.
+    Runs ONE predict on the whole list, so the model setup cost is paid once.
+
+    Returns a list with one (annotated, card_poses, found_cards) per frame,
+    in the same order as frames.
+    """
+    if not frames:
+        return []
+
+    results = cards_model.predict(list(frames), **PREDICT_ARGS)
+    return [
+        process_result(frame, res, output_id, RUN_ID, save_outputs, with_confidence)
+        for frame, res, output_id in zip(frames, results, output_ids)
+    ]
+
+
+def process_result(frame, res, output_id, RUN_ID, save_outputs=False, with_confidence=False):
+    """
+    Turns one YOLO result into card positions (and the drawn image).
+    Shared by discover_cards and discover_cards_batch.
+    """
+    return finish_cards(frame, card_boxes(res), output_id, RUN_ID, save_outputs, with_confidence,
+                        speed=getattr(res, "speed", None))
+
+
+class CardBoxes:
+    """
+    All the boxes YOLO found in one frame, as arrays instead of one object per box:
+      xyxy  (N, 4) corners in pixels
+      conf  (N,)   confidence
+      cls   (N,)   class id, names[cls] is the label ("8H", "KS", ...)
+    """
+
+    def __init__(self, xyxy, conf, cls, names):
+        self.xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float64).reshape(-1)
+        self.cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+        self.names = names
+
+    def __len__(self):
+        return len(self.conf)
+
+    def centers(self):
+        return (self.xyxy[:, :2] + self.xyxy[:, 2:]) / 2
+
+    def labels(self):
+        return [self.names[int(c)] for c in self.cls]
+
+    def select(self, index):
+        return CardBoxes(self.xyxy[index], self.conf[index], self.cls[index], self.names)
+
+    @staticmethod
+    def concat(parts, names):
+        if not parts:
+            return CardBoxes(np.zeros((0, 4)), [], [], names)
+        return CardBoxes(
+            np.concatenate([p.xyxy for p in parts]),
+            np.concatenate([p.conf for p in parts]),
+            np.concatenate([p.cls for p in parts]),
+            names,
         )
-    # Group by label
-    label_groups = defaultdict(list)
-    for card in cards:
-        label_groups[card["label"]].append(card)
-
-    pair_centers = []   # middle points for duplicated cards
-    card_poses = {}     # final per-card position
-    # Middle points for duplicated cards
-    for label, data in label_groups.items():
-        if len(data) > 2:
-            data.sort(key=lambda x: x["confidence"], reverse=True)
-        if len(data) >= 2:
-            if(found_card(data)):
-                c1, c2 = data[0]["center"], data[1]["center"]
-                mid_x = (c1[0] + c2[0]) / 2
-                mid_y = (c1[1] + c2[1]) / 2
-                pair_centers.append({"Card": label, "middle": (mid_x, mid_y)})
-                card_poses[label] = [mid_x, mid_y]
-                drawing_ops.append(
-                    DrawImages(mid_x, mid_y, label, (0, 255, 0)).draw_card
-                )
-        elif len(data)==1:
-            # TODO FIND A WAY TO FIND THE CENTER
-            if (data[0]["confidence"]>0.8):
-                c = (data[0]["edges"][2],data[0]["edges"][3])
-                pair_centers.append({"Card": label, "middle": (c[0], c[1])})
-                card_poses[label] = [c[0], c[1]]
-                drawing_ops.append(
-                    DrawImages(c[0], c[1], label, (0, 255, 0)).draw_card
-                )
-
-    # For labels that appear only once (or more than twice), use the single center
+
+    def to_dicts(self):
+        """The boxes as card dicts (label, confidence, edges, center)."""
+        return [
+            {
+                "label": label,
+                "confidence": float(conf),
+                "edges": tuple(float(v) for v in box),
+                "center": (float(c[0]), float(c[1])),
+            }
+            for label, conf, box, c in zip(self.labels(), self.conf, self.xyxy, self.centers())
+        ]
+
+
+def card_boxes(res, offset=(0, 0)):
+    """
+    Reads the YOLO boxes of one result into CardBoxes (whole arrays, no loop per box).
+    offset = (x, y) of the crop inside the full frame, so boxes found on a
+             crop come back in full-frame coordinates.
+    """
+    boxes = res.boxes.cpu().numpy()
+    ox, oy = offset
+    xyxy = boxes.xyxy.astype(np.float64) + np.array([ox, oy, ox, oy], dtype=np.float64)
+    return CardBoxes(xyxy, boxes.conf, boxes.cls, res.names)
+
+
+def extract_cards(res, offset=(0, 0)):
+    """Reads the YOLO boxes into card dicts (see CardBoxes.to_dicts)."""
+    return card_boxes(res, offset).to_dicts()
+
+
+def pair_cards(boxes):
+    """
+    Every card has two corners with the label, YOLO finds each one as a box.
+    Turns the boxes (CardBoxes) into one position per card:
+      - two (or more) boxes of a label -> the middle of the two most
+        confident ones, if they are sure enough together (conf1^2 + conf2^2 > 1)
+      - one box -> its bottom right corner, if it is very sure (> 0.8)
+
+    Returns (card_poses, card_confs):
+    card_poses[label] = [x, y], card_confs[label] = confidence of the card
+    """
+    n = len(boxes)
+    if n == 0:
+        return {}, {}
+    conf, cls = boxes.conf, boxes.cls
+    centers = boxes.centers()
+
+    # group by label, most confident first (stable, equal confidences keep YOLO order)
+    order = np.lexsort((-conf, cls))
+    _, starts, counts = np.unique(cls[order], return_index=True, return_counts=True)
+    best = order[starts]
+    second = order[np.minimum(starts + 1, n - 1)]      # only used where counts >= 2
+    first_seen = np.minimum.reduceat(order, starts)     # keeps the labels in YOLO order
+
+    c1, c2 = conf[best], conf[second]
+    paired = (counts >= 2) & (c1 ** 2 + c2 ** 2 > 1)
+    # TODO FIND A WAY TO FIND THE CENTER of a single corner
+    single = (counts == 1) & (c1 > 0.8)
+
+    xy = np.where(paired[:, None], (centers[best] + centers[second]) / 2, boxes.xyxy[best, 2:4])
+    xy_conf = np.where(paired, (c1 + c2) / 2, c1)
+
+    keep = np.flatnonzero(paired | single)
+    keep = keep[np.argsort(first_seen[keep], kind="stable")]
+
+    # only now back to python dicts
+    card_poses = {}
+    card_confs = {}
+    for i in keep:
+        label = boxes.names[int(cls[best[i]])]
+        card_poses[label] = [float(xy[i, 0]), float(xy[i, 1])]
+        card_confs[label] = float(xy_conf[i])
+    return card_poses, card_confs
+
+
+def card_overlay(boxes, card_poses):
+    """Every box center (red) and every paired card position (green), as an Overlay."""
+    overlay = Overlay()
+    for label, (cx, cy), box in zip(boxes.labels(), boxes.centers(), boxes.xyxy):
+        overlay.card(cx, cy, label, (0, 0, 255), box=tuple(box))
+    for label, (x, y) in card_poses.items():
+        overlay.card(x, y, label, (0, 255, 0))
+    return overlay
+
+
+def finish_cards(frame, boxes, output_id, RUN_ID, save_outputs=False, with_confidence=False, speed=None):
+    """
+    Pairs the card corners (CardBoxes) into per-card positions, draws them
+    and optionally saves the results.
+    speed = YOLO timing of this frame in ms (res.speed), goes to the log
+
+    Returns (annotated, card_poses, found_cards) like discover_cards.
+    """
+    card_poses, card_confs = pair_cards(boxes)
     found_cards = list(card_poses.keys())
 
-    # ---------------------------------------
-    # DRAW EVERYTHING *NOW*, AFTER ALL FOUND
-    # ---------------------------------------
-    for draw in drawing_ops:
-        draw(img)
+    # everything drawn in one pass on a reused buffer (the frame itself is only read),
+    # a saved image gets its own copy because the writer holds on to it.
+    # headless runs return the frame untouched (unless we save the marked image)
+    if drawimages.headless and not save_outputs:
+        img = frame
+    else:
+        img = card_overlay(boxes, card_poses).render(frame, reuse=not save_outputs)
 
     # Save outputs (only when we ask for saved frames, not every frame)
+    # the writer thread does the jpeg encoding and the file writing
     if save_outputs:
         mark_path = f"results/marked/frame_{RUN_ID}_{output_id:04d}_marked.jpg"
-        text_path = f"results/texts/frame_{RUN_ID}_{output_id:04d}.txt"
+        get_output_writer().save_image(mark_path, img)
+
+    # one line per frame in the run's detection log (instead of a text file per frame)
+    log = active_log(RUN_ID, save_outputs)
+    if log is not None:
+        fields = dict(
+            boxes=boxes.xyxy,
+            labels=boxes.labels(),
+            confs=boxes.conf,
+            pairs=card_poses,
+        )
+        if speed:
+            fields["timing"] = {f"yolo_{name}_ms": ms for name, ms in speed.items()}
+        log.add(output_id, **fields)
 
-        cv2.imwrite(mark_path, img)
+    if with_confidence:
+        return img, card_poses, found_cards, card_confs
+    return img, card_poses, found_cards
 
-        with open(text_path, "w") as f:
-            f.write(f"Run {RUN_ID}, Frame {output_id}\n")
-            f.write("===========================\n\n")
-            f.write("Detected cards:\n\n")
-            for c in cards:
-                f.write(f"Card: {c['label']}\n")
-                f.write(f"Edges: {c['edges']}\n")
-                f.write(f"Center: {c['center']}\n\n")
 
-            f.write("\nPairs (2 cards):\n")
-            for p in pair_centers:
-                f.write(f"{p['Card']}: middle = {p['middle']}\n")
 
-            # set of labels that appear in pairs
-            paired_labels = {p["Card"] for p in pair_centers}
+# ----------------------------------------------------
+# ROI MODE: only look around the player / dealer tags
+# ----------------------------------------------------
+def tag_roi(april_pose, camera_params, frame_shape, roi_size):
+    """
+    Square crop around an AprilTag.
+    roi_size = half the width of the crop, in meters on the table.
+    Returns (x1, y1, x2, y2) in pixels or None if it falls outside the frame.
+    """
+    if april_pose is None:
+        return None
+    fx, fy, cx, cy = camera_params
+    x, y, z = april_pose
+    if z <= 0:
+        return None
 
-            f.write("\n1-Card (no pair center):\n\n")
+    # project the tag center back into the image
+    u = fx * x / z + cx
+    v = fy * y / z + cy
+    half_w = fx * roi_size / z
+    half_h = fy * roi_size / z
 
-            for c in cards:
-                if c["label"] not in paired_labels:
-                    f.write(f"Card: {c['label']}\n")
-                    f.write(f"Edges: {c['edges']}\n")
-                    f.write(f"Center: {c['center']}\n\n")
+    h, w = frame_shape[:2]
+    x1, y1 = max(int(u - half_w), 0), max(int(v - half_h), 0)
+    x2, y2 = min(int(u + half_w), w), min(int(v + half_h), h)
+    if x2 - x1 < 32 or y2 - y1 < 32:
+        return None
+    return x1, y1, x2, y2
 
 
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(ix2 - ix1, 0) * max(iy2 - iy1, 0)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / (area_a + area_b - inter)
 
-    return img, card_poses, found_cards
+
+def box_ious(xyxy):
+    """IoU of every box with every box, (N, 4) -> (N, N)."""
+    tl = np.maximum(xyxy[:, None, :2], xyxy[None, :, :2])
+    br = np.minimum(xyxy[:, None, 2:], xyxy[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    union = area[:, None] + area[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
 
 
+def merge_duplicates(boxes, iou_threshold=0.6):
+    """
+    When two crops overlap the same corner is found twice.
+    Keep the most confident one of every same-label pair that overlaps.
+    """
+    if len(boxes) < 2:
+        return boxes
+    duplicate = (boxes.cls[:, None] == boxes.cls[None, :]) & (box_ious(boxes.xyxy) > iou_threshold)
+    kept = []
+    for i in np.argsort(-boxes.conf, kind="stable"):
+        if not duplicate[i, kept].any():
+            kept.append(i)
+    return boxes.select(np.array(kept, dtype=np.int64))
+
+
+def discover_cards_roi(frame, april_poses, camera_params, output_id, RUN_ID,
+                       tag_ids=(1, 0), roi_size=0.3, imgsz=640, save_outputs=False,
+                       with_confidence=False):
+    """
+    Like discover_cards, but YOLO only sees the crops around the tags in
+    tag_ids (1 = player, 0 = dealer), at a smaller imgsz.
+    Boxes are moved back to full-frame coordinates, so the result looks
+    exactly like discover_cards.
+
+    If none of the tags is visible we fall back to the full frame.
+    """
+    rois = []
+    for tag_id in tag_ids:
+        roi = tag_roi(april_poses.get(tag_id), camera_params, frame.shape, roi_size)
+        if roi is not None:
+            rois.append(roi)
+
+    if not rois:
+        return discover_cards(frame, output_id, RUN_ID, save_outputs, with_confidence)
+
+    crops = [frame[y1:y2, x1:x2] for (x1, y1, x2, y2) in rois]
+    args = dict(PREDICT_ARGS, imgsz=imgsz)
+    results = cards_model.predict(crops, **args)
+
+    parts = []
+    speed = defaultdict(float)      # YOLO time of all the crops together
+    for (x1, y1, _, _), res in zip(rois, results):
+        parts.append(card_boxes(res, offset=(x1, y1)))
+        for name, ms in (getattr(res, "speed", None) or {}).items():
+            speed[name] += ms
+    boxes = CardBoxes.concat(parts, results[0].names)
+    if len(rois) > 1:
+        boxes = merge_duplicates(boxes)
+
+    return finish_cards(frame, boxes, output_id, RUN_ID, save_outputs, with_confidence, speed=dict(speed))
+
 
 def pixel_to_camera(u, v, Z, fx, fy, cx, cy):
     """
@@ -160,3 +383,13 @@ def pixel_to_camera(u, v, Z, fx, fy, cx, cy):
     return [X, Y, Z]
 
 
+def pixels_to_camera(uv, Z, fx, fy, cx, cy):
+    """pixel_to_camera for many pixels at once: (N, 2) pixels -> (N, 3) meters."""
+    uv = np.asarray(uv, dtype=np.float64).reshape(-1, 2)
+    xyz = np.empty((len(uv), 3))
+    xyz[:, 0] = (uv[:, 0] - cx) * Z / fx
+    xyz[:, 1] = (uv[:, 1] - cy) * Z / fy
+    xyz[:, 2] = Z
+    return xyz
+
+
@@ -1,6 +1,34 @@
+import os
+
 import cv2
+import numpy as np
+
+from frame_buffers import BufferRing
+
+# MAGIC_HEADLESS=1 -> nobody looks at the frames, skip all the drawing
+# (and the copies we only make to draw on). See set_headless.
+headless = os.environ.get("MAGIC_HEADLESS") == "1"
+
+
+def set_headless(on=True):
+    """Turn all annotation work off (True) or back on (False), at runtime."""
+    global headless
+    headless = on
+
+
+# the images render(reuse=True) draws on, reused frame after frame
+annotation_buffers = BufferRing(4)
+
+
+def reserve_annotation_buffers(n):
+    """Keep the last n annotated images untouched (callers that hold a batch of them)."""
+    annotation_buffers.reserve(n)
+
 
 class DrawImages:
+    # a lot of these are made every frame, keep them small
+    __slots__ = ("x", "y", "label", "color", "box")
+
     def __init__(self, x, y, label, color, box=None):
         """
         x, y     = center of the object (cx, cy)
@@ -42,16 +70,17 @@ class DrawImages:
     def draw_card(self, image):
         cv2.circle(image, (self.x, self.y), 6, self.color, -1)
 
-        text_pos = self.smart_label_position()
-        cv2.putText(
-            image,
-            self.label,
-            text_pos,
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.7,
-            self.color,
-            2
-        )
+        if self.label:
+            text_pos = self.smart_label_position()
+            cv2.putText(
+                image,
+                self.label,
+                text_pos,
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.7,
+                self.color,
+                2
+            )
 
     # ------------------------------------------------------
     # APRIL TAG: draw a box + center circle + label inside box
@@ -73,3 +102,57 @@ class DrawImages:
             self.color,
             2
         )
+
+
+class Overlay:
+    """
+    Everything we want to draw on one frame, drawn in a single pass.
+
+    The detectors only add DrawImages records (no drawing, no copy while
+    detecting), render() then copies the frame once and draws all of them.
+
+        overlay = Overlay()
+        overlay.card(x, y, "8H", (0, 255, 0))
+        img = overlay.render(frame)              # new image
+        img = overlay.render(frame, reuse=True)  # no allocation
+
+    With reuse=True the image comes from annotation_buffers and is drawn
+    over again a few renders later, so dont keep it (or give it to the
+    OutputWriter), use reuse=False for that.
+    """
+
+    def __init__(self):
+        self.cards = []    # circle + label
+        self.tags = []     # box + circle + label
+
+    def card(self, x, y, label, color, box=None):
+        self.cards.append(DrawImages(x, y, label, color, box))
+
+    def tag(self, x, y, label, color, box=None):
+        self.tags.append(DrawImages(x, y, label, color, box))
+
+    def extend(self, other):
+        self.cards.extend(other.cards)
+        self.tags.extend(other.tags)
+        return self
+
+    def clear(self):
+        self.cards.clear()
+        self.tags.clear()
+
+    def draw(self, image):
+        """Draws everything straight onto image (no copy)."""
+        for rec in self.tags:
+            rec.draw_tag(image)
+        for rec in self.cards:
+            rec.draw_card(image)
+        return image
+
+    def render(self, frame, reuse=False):
+        """A copy of frame with everything drawn on it (frame itself is not changed)."""
+        if reuse:
+            img = annotation_buffers.like(frame)
+            np.copyto(img, frame)
+        else:
+            img = frame.copy()
+        return self.draw(img)
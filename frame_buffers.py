@@ -0,0 +1,50 @@
+import threading
+
+import numpy as np
+
+
+class BufferRing:
+    """
+    A few preallocated frame-sized arrays, handed out round robin.
+
+    get() returns an array that nobody got in the last `size - 1` calls,
+    so an image from get() stays untouched for the next size - 1 frames.
+    After the first `size` calls nothing is allocated anymore (unless the
+    frame size changes).
+
+    reserve(n) makes the ring at least n big, for callers that hold on to
+    more frames at once (batches, the pipeline).
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self.buffers = []
+        self.next = 0
+        self.lock = threading.Lock()
+        self.allocations = 0
+
+    def reserve(self, size):
+        with self.lock:
+            self.size = max(self.size, size)
+
+    def get(self, shape, dtype=np.uint8):
+        with self.lock:
+            if len(self.buffers) < self.size:
+                buf = np.empty(shape, dtype)
+                self.buffers.append(buf)
+                self.allocations += 1
+                return buf
+
+            i = self.next
+            self.next = (self.next + 1) % len(self.buffers)
+            buf = self.buffers[i]
+            if buf.shape != tuple(shape) or buf.dtype != dtype:
+                # the camera changed resolution
+                buf = np.empty(shape, dtype)
+                self.buffers[i] = buf
+                self.allocations += 1
+            return buf
+
+    def like(self, frame):
+        """A buffer with the shape and dtype of frame."""
+        return self.get(frame.shape, frame.dtype)
@@ -0,0 +1,87 @@
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FramePipeline:
+    """
+    Runs the per-frame work on a thread pool so it overlaps:
+
+      - AprilTag detection and card detection run at the same time on the
+        same frame (the apriltag C code and torch both release the GIL)
+      - while frame N is being detected, frame N+1 is already being read
+
+    The results come out per frame and in order, exactly like running the
+    two detectors one after the other.
+
+    Shut the threads down with close(), or use it as a context manager:
+
+        with FramePipeline() as pipeline:
+            for frame_id, frame, tags, cards in pipeline.run(...):
+                ...
+    """
+
+    def __init__(self, workers=None):
+        if workers is None:
+            # capture + tags + cards
+            workers = min(3, os.cpu_count() or 1)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def run(self, cap, count, detect_tags, detect_cards, cards_need_tags=False, frame_ids=None):
+        """
+        Yields (frame_id, frame, tag_result, card_result) for up to `count` frames.
+
+        detect_tags(frame, frame_id)  -> whatever detect_apriltags returns
+        detect_cards(frame, frame_id) -> whatever discover_cards returns
+        cards_need_tags = True when detect_cards needs the tags first
+                          (ROI mode), then it is called as
+                          detect_cards(frame, frame_id, tag_result) after
+                          the tags, and only the capture overlaps.
+        frame_ids       = iterator of ids for the frames (default 0, 1, 2...)
+        """
+        if count <= 0:
+            return
+        if frame_ids is None:
+            frame_ids = itertools.count()
+
+        next_read = self.pool.submit(cap.read)
+        try:
+            produced = 0
+            while produced < count:
+                ret, frame = next_read.result()
+                next_read = None
+                if not ret:
+                    return
+                produced += 1
+                frame_id = next(frame_ids)
+
+                # start grabbing the next frame while we work on this one
+                if produced < count:
+                    next_read = self.pool.submit(cap.read)
+
+                tags_job = self.pool.submit(detect_tags, frame, frame_id)
+                if cards_need_tags:
+                    tag_result = tags_job.result()
+                    card_result = self.pool.submit(detect_cards, frame, frame_id, tag_result).result()
+                else:
+                    cards_job = self.pool.submit(detect_cards, frame, frame_id)
+                    tag_result = tags_job.result()
+                    card_result = cards_job.result()
+
+                yield frame_id, frame, tag_result, card_result
+        finally:
+            # the consumer stopped early: the frame we read ahead was never
+            # used, give it back to the source instead of losing it
+            if next_read is not None and not next_read.cancel():
+                ret, frame = next_read.result()
+                if ret and hasattr(cap, "unread"):
+                    cap.unread(frame)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,284 @@
+import atexit
+import os
+import threading
+import time
+
+import cv2
+
+from camera_session import get_camera_session
+from frame_buffers import BufferRing
+from output_writer import OutputWriter
+
+# ----------------------------------------------------
+# Where the frames come from.
+#
+# FRAME_SOURCE=camera              live camera (default)
+# FRAME_SOURCE=record:<folder>     live camera, and every frame we read is
+#                                  saved to <folder> with its timestamp
+#                                  (lossless, RECORD_CODEC=ffv1|png|mjpg)
+# FRAME_SOURCE=replay:<folder>     play a recording at its real speed
+# FRAME_SOURCE=replay-max:<folder> play a recording as fast as we can read
+#
+# Everything that used a camera gets its frames from get_frame_source(),
+# so a recording goes through the exact same code as the camera.
+# ----------------------------------------------------
+
+VIDEO_NAME = "frames.avi"
+IMAGES_NAME = "frames"            # png sequence: frames/000000.png, ...
+IMAGE_PATTERN = "%06d.png"
+TIMES_NAME = "timestamps.txt"
+CODECS = ("ffv1", "png", "mjpg")
+
+
+class RecordingSource:
+    """
+    Wraps another source and saves every frame that is read from it.
+
+    folder/frames.avi      the frames (FFV1 or MJPG)
+    folder/frames/         or the frames as 000000.png, 000001.png ...
+    folder/timestamps.txt  seconds since the recording started, one per frame
+
+    codec = "ffv1" lossless video (default), the replay gives YOLO and the
+                   tag detector exactly the pixels the live run saw
+            "png"  lossless image sequence, bigger and slower to write
+            "mjpg" small but lossy, a replay is only close to the live run
+    If this OpenCV cannot write FFV1 we fall back to png.
+
+    The encoding runs on an OutputWriter thread of its own, read() only
+    stamps the time, copies the frame into a free buffer and queues it.
+    max_queue = frames that can wait for the encoder. The queue blocks
+                instead of dropping when it is full, a recording has every
+                frame or it is no replay of the run.
+    """
+
+    def __init__(self, source, folder, fps=30.0, codec="ffv1", max_queue=16):
+        if codec not in CODECS:
+            raise ValueError(f"unknown codec {codec}")
+        os.makedirs(folder, exist_ok=True)
+        self.source = source
+        self.folder = folder
+        self.fps = fps
+        self.codec = codec
+        self.writer = None
+        self.output = OutputWriter(max_queue=max_queue, drop_policy="block")
+        # queued + the one being written + the one we copy into
+        self.buffers = BufferRing(max_queue + 2)
+        self.times = open(os.path.join(folder, TIMES_NAME), "w")
+        self.start = None
+        self.frames_recorded = 0
+        self.lock = threading.Lock()
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def read(self):
+        ret, frame = self.source.read()
+        if not ret:
+            return ret, frame
+
+        # the time the frame arrived, not when it is on disk
+        now = time.monotonic()
+        with self.lock:
+            if self.start is None:
+                self._open_writer(frame)
+                self.start = now
+            # the source reuses its buffers, the writer gets its own copy
+            copy = self.buffers.like(frame)
+            copy[...] = frame
+            if self.writer is not None:
+                self.output.save_frame(self.writer, os.path.join(self.folder, VIDEO_NAME), copy)
+            else:
+                self.output.save_image(
+                    os.path.join(self.folder, IMAGES_NAME, IMAGE_PATTERN % self.frames_recorded), copy
+                )
+            self.times.write(f"{now - self.start:.6f}\n")
+            self.frames_recorded += 1
+        return ret, frame
+
+    def _open_writer(self, frame):
+        if self.codec in ("ffv1", "mjpg"):
+            h, w = frame.shape[:2]
+            fourcc = "FFV1" if self.codec == "ffv1" else "MJPG"
+            writer = cv2.VideoWriter(
+                os.path.join(self.folder, VIDEO_NAME),
+                cv2.VideoWriter_fourcc(*fourcc),
+                self.fps,
+                (w, h),
+            )
+            if writer.isOpened():
+                self.writer = writer
+                return
+            print(f"cant write {fourcc} here, recording png frames instead")
+            self.codec = "png"
+        os.makedirs(os.path.join(self.folder, IMAGES_NAME), exist_ok=True)
+
+    def reserve(self, keep):
+        if hasattr(self.source, "reserve"):
+            self.source.reserve(keep)
+
+    def unread(self, frame):
+        if hasattr(self.source, "unread"):
+            self.source.unread(frame)
+
+    def release(self):
+        # the camera underneath is shared, keep it open
+        pass
+
+    def close(self):
+        with self.lock:
+            # every queued frame goes into the file before it is finished
+            self.output.close()
+            if self.writer is not None:
+                self.writer.release()
+                self.writer = None
+            if not self.times.closed:
+                self.times.close()
+
+
+class ReplaySource:
+    """
+    Plays a recording made by RecordingSource, with the same read() as a camera.
+
+    realtime = True  -> frames come at the speed they were recorded
+               False -> as fast as we can decode them (benchmarks, tests)
+    loop     = start over at the end instead of returning (False, None)
+    keep     = like CameraSession, the last `keep` frames from read() stay
+               untouched, older buffers are decoded into again
+
+    A frame given back with unread() is the next one read() returns, so a
+    replay never skips a frame (unlike the camera, where it is stale).
+    """
+
+    def __init__(self, folder, realtime=True, loop=False, keep=4):
+        self.folder = folder
+        self.realtime = realtime
+        self.loop = loop
+        self.buffers = BufferRing(keep)
+        self.frame_shape = None
+
+        video_path = os.path.join(folder, VIDEO_NAME)
+        if not os.path.exists(video_path):
+            # a png recording, OpenCV reads the numbered files like a video
+            video_path = os.path.join(folder, IMAGES_NAME, IMAGE_PATTERN)
+            if not os.path.exists(video_path % 0):
+                raise FileNotFoundError(f"no recording in {folder}")
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise Exception(f"Could not open recording {video_path}")
+
+        times_path = os.path.join(folder, TIMES_NAME)
+        self.times = []
+        if os.path.exists(times_path):
+            with open(times_path) as f:
+                self.times = [float(line) for line in f if line.strip()]
+
+        self.index = 0
+        self.start = None
+        self.pushed_back = None
+        self.lock = threading.Lock()
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def _decode(self):
+        if self.frame_shape is None:
+            ret, frame = self.cap.read()
+            if ret:
+                self.frame_shape = frame.shape
+            return ret, frame
+        return self.cap.read(self.buffers.get(self.frame_shape))
+
+    def read(self):
+        with self.lock:
+            if self.pushed_back is not None:
+                frame, self.pushed_back = self.pushed_back, None
+                return True, frame
+            ret, frame = self._decode()
+            if not ret and self.loop and self.index > 0:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self.index = 0
+                self.start = None
+                ret, frame = self._decode()
+            if not ret:
+                return False, None
+
+            if self.realtime and self.index < len(self.times):
+                if self.start is None:
+                    self.start = time.monotonic() - self.times[self.index]
+                wait = self.start + self.times[self.index] - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            self.index += 1
+            return True, frame
+
+    def unread(self, frame):
+        with self.lock:
+            self.pushed_back = frame
+
+    def reserve(self, keep):
+        self.buffers.reserve(keep)
+
+    def release(self):
+        pass
+
+    def close(self):
+        with self.lock:
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+
+
+def open_frame_source(spec=None, src=0, api=cv2.CAP_DSHOW, width=None, height=None):
+    """
+    Builds a source from a spec string (see the top of this file).
+    spec=None reads the FRAME_SOURCE environment variable.
+    """
+    if spec is None:
+        spec = os.environ.get("FRAME_SOURCE", "camera")
+
+    kind, _, folder = spec.partition(":")
+    if kind == "camera":
+        return get_camera_session(src, api, width=width, height=height)
+    if kind == "record":
+        codec = os.environ.get("RECORD_CODEC", "ffv1")
+        return RecordingSource(get_camera_session(src, api, width=width, height=height), folder, codec=codec)
+    if kind == "replay":
+        return ReplaySource(folder, realtime=True)
+    if kind == "replay-max":
+        return ReplaySource(folder, realtime=False)
+    raise ValueError(f"unknown frame source {spec}")
+
+
+# ----------------------------------------------------
+# one source for the whole process
+# ----------------------------------------------------
+_source = None
+_source_lock = threading.Lock()
+
+
+def get_frame_source(src=0, api=cv2.CAP_DSHOW, width=None, height=None):
+    """The shared frame source (camera, recording or replay, see FRAME_SOURCE)."""
+    global _source
+    with _source_lock:
+        if _source is None:
+            _source = open_frame_source(None, src, api, width, height)
+        return _source
+
+
+def set_frame_source(source):
+    """Use `source` (anything with read()) from now on, e.g. a ReplaySource in a test."""
+    global _source
+    with _source_lock:
+        _source = source
+
+
+def close_frame_source():
+    # the camera session closes itself, recordings need their file finished
+    global _source
+    with _source_lock:
+        if isinstance(_source, (RecordingSource, ReplaySource)):
+            _source.close()
+        _source = None
+
+
+atexit.register(close_frame_source)
@@ -1,5 +1,8 @@
 from game_env import Deck, dealer_play, utility, hand_value
 from bj_player import Agent
+from metrics import get_metrics
+
+metrics = get_metrics()
 
 
 def pre_deal_environment(deck, agent, num_other_players=3, cards_per_player=2):
@@ -51,7 +54,8 @@ def play_round(agent, deck):
 
     # 5. Agent’s hit/stand loop
     while True:
-        action = agent.decide_action(hand, deck, dealer_upcard)
+        with metrics.span("decision"):
+            action = agent.decide_action(hand, deck, dealer_upcard)
         if action == "stand":
             break
 
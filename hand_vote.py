@@ -0,0 +1,78 @@
+from collections import defaultdict
+from statistics import NormalDist
+
+
+class HandVote:
+    """
+    Streaming vote for the cards of one hand (player or dealer).
+
+    Every frame votes for the cards it thinks are in the hand, and each vote
+    is weighted by how sure YOLO was about that card. We stop as soon as
+    the top `num_cards` cards clearly beat the rest:
+
+        (score of k-th card - score of (k+1)-th card)
+        ----------------------------------------------  >  z
+           sqrt(score of k-th + score of (k+1)-th)
+
+    where z comes from `confidence` (0.95 -> 1.645). A score is at most 1 per
+    frame, so this is the usual "is the difference bigger than the noise"
+    test for two counts.
+
+    min_frames = never decide before this many fresh votes
+    max_frames = give up waiting and use what we have after this many frames
+
+    Only fresh detections are votes. A frame the MotionGate skipped just
+    repeats the last YOLO result, counting it again would make one
+    inference look like many independent samples (add(..., fresh=False)
+    only counts the frame).
+    """
+
+    def __init__(self, num_cards, confidence=0.95, min_frames=10, max_frames=100):
+        self.num_cards = num_cards
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.z = NormalDist().inv_cdf(confidence)
+
+        self.scores = defaultdict(float)   # card -> sum of confidences
+        self.frames = 0                    # fresh votes
+        self.frames_seen = 0               # all frames, fresh or not
+
+    def add(self, cards, card_confs=None, fresh=True):
+        """
+        One frame worth of votes. card_confs[card] = YOLO confidence.
+        fresh = False for a reused detection, it does not vote.
+        """
+        self.frames_seen += 1
+        if not fresh:
+            return
+        self.frames += 1
+        for card in cards:
+            if card_confs is None:
+                self.scores[card] += 1.0
+            else:
+                self.scores[card] += card_confs.get(card, 1.0)
+
+    def ranked(self):
+        return sorted(self.scores.items(), key=lambda x: x[1], reverse=True)
+
+    def top(self):
+        """The best num_cards cards, strongest first."""
+        return [card for card, _ in self.ranked()[:self.num_cards]]
+
+    def is_stable(self):
+        if self.num_cards <= 0:
+            return True
+        # max_frames wins, a gated run may never collect min_frames votes
+        if self.frames_seen >= self.max_frames:
+            return True
+        if self.frames < self.min_frames:
+            return False
+
+        ranked = self.ranked()
+        if len(ranked) < self.num_cards:
+            # we did not even see enough cards yet
+            return False
+
+        kth = ranked[self.num_cards - 1][1]
+        runner_up = ranked[self.num_cards][1] if len(ranked) > self.num_cards else 0.0
+        return (kth - runner_up) / ((kth + runner_up) ** 0.5) > self.z
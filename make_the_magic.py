@@ -2,14 +2,29 @@ import os
 import cv2
 import time
 import sys
-from collections import defaultdict
 import math
-from discover_cards_frames import discover_cards,pixel_to_camera
-from april_tags_frames import detect_apriltags
+import itertools
+from contextlib import nullcontext
+import discover_cards_frames
+from discover_cards_frames import discover_cards,discover_cards_batch,discover_cards_roi,pixels_to_camera
+from april_tags_frames import detect_apriltags, TagPoseCache, DetectionConfig
+from frame_source import get_frame_source
+from undistort import UndistortedSource
+from calibration_profile import get_profile
+from table_plane import TablePlane
+from card_assignment import assign_cards
+from position_aggregator import PositionAggregator
+from motion_gate import MotionGate
+from frame_pipeline import FramePipeline
+from hand_vote import HandVote
+from detection_log import get_detection_log
+from metrics import get_metrics
+from frame_buffers import BufferRing
 import numpy as np
+import drawimages
 # Setup folders
 os.makedirs("results/photos", exist_ok=True)
-os.makedirs("results/texts", exist_ok=True)
+os.makedirs("results/logs", exist_ok=True)
 os.makedirs("results/marked", exist_ok=True)
 
 # RUN ID SYSTEM
@@ -29,22 +44,83 @@ with open(RUN_FILE, "w") as f:
 
 print(f"Starting RUN #{RUN_ID}")
 
-# our digital camera calibration data
-K = [
-    [1.39561099e+03, 0.00000000e+00, 8.85690305e+02],
-    [0.00000000e+00, 1.38830766e+03, 5.04754597e+02],
-    [0.00000000e+00, 0.00000000e+00, 1.00000000e+00],
-]
-D = [-0.07011441, 0.24724181, 0.00124205, -0.00364551, -0.27059026]
+# MAGIC_RECORD=1 writes every frame (boxes, pairs, tags, timing) to results/logs/run_{RUN_ID}.jsonl
+if os.environ.get("MAGIC_RECORD") == "1":
+    discover_cards_frames.set_detection_log(get_detection_log(RUN_ID))
 
-fx = K[0][0]
-fy = K[1][1]
-cx = K[0][2]
-cy = K[1][2]
+# every frame of the run gets its own id (names of saved files, log lines)
+frame_counter = itertools.count()
+
+# timings and counters of the loop (see metrics.py)
+# MAGIC_METRICS_PORT=9100 serves them over http, MAGIC_OVERLAY=1 writes them on the live view.
+# MAGIC_HEADLESS=1 (see drawimages.py) skips the window and all the drawing
+metrics = get_metrics()
+show_metrics = os.environ.get("MAGIC_OVERLAY") == "1"
+# the live view with the metrics on it, its own image: the annotated frame
+# is a reused (or gated, cached) image, text drawn on it would pile up
+display_buffer = BufferRing(1)
+
+
+def live_view(annotated):
+    """What the window shows: annotated, plus the metrics on a copy when MAGIC_OVERLAY=1."""
+    if not show_metrics:
+        return annotated
+    view = display_buffer.like(annotated)
+    np.copyto(view, annotated)
+    return metrics.draw_overlay(view)
+
+# our digital camera calibration data (caliberation/profiles/camera.json,
+# MAGIC_CALIBRATION=<name> for another one, see calibration_profile.py)
+profile = get_profile()
+K = profile.K
+D = profile.D
+
+fx, fy, cx, cy = profile.camera_params
 
 camera_params = [fx, fy, cx, cy]
 tag_id_for_depth = 1
 
+# MAGIC_UNDISTORT=1 removes the lens distortion (D) from every frame before
+# detection. The undistorted frames have their own camera matrix, so from
+# here on fx, fy, cx, cy and camera_params are the ones of the new frames.
+CAMERA_SIZE = profile.size   # the resolution K was calibrated at
+undistorter = None
+if os.environ.get("MAGIC_UNDISTORT") == "1":
+    undistorter = profile.undistorter()
+    fx, fy, cx, cy = undistorter.camera_params
+    camera_params = [fx, fy, cx, cy]
+
+# MAGIC_UNDISTORT_POINTS=1 only undistorts what we measure: the card centers
+# and the tag corners (a few dozen points instead of a full frame remap)
+point_undistorter = None
+if undistorter is None and os.environ.get("MAGIC_UNDISTORT_POINTS") == "1":
+    point_undistorter = profile.point_undistorter()
+_camera = None
+
+
+def open_camera():
+    """The shared frame source, undistorted when MAGIC_UNDISTORT=1."""
+    global _camera
+    if _camera is None:
+        if undistorter is not None:
+            _camera = UndistortedSource(
+                get_frame_source(width=CAMERA_SIZE[0], height=CAMERA_SIZE[1]), undistorter
+            )
+        else:
+            _camera = get_frame_source()
+    return _camera
+
+# skips YOLO while the table does not change. take_a_pic does not use it
+# by default (see there), pass gate=motion_gate to trade votes for speed
+motion_gate = MotionGate()
+# the tags are taped to the table, find them once and reuse the poses.
+# quick half-size search first, full size only when a table tag is missing.
+# the game only reads tag 1 (player) and tag 0 (dealer), tag 2 is used when
+# it is seen but a frame without it is still complete
+GAME_TAGS = (0, 1)
+tag_config = DetectionConfig("adaptive", expected_ids=GAME_TAGS)
+tag_cache = TagPoseCache(config=tag_config, undistorter=point_undistorter, required_ids=GAME_TAGS)
+
 # ----------------------------------------------------
 # every frames goes to both functions
 # ----------------------------------------------------
@@ -61,107 +137,326 @@ def find_closest(april_poses, card_poses, found_cards, num_of_cards, tag_id=1):
         sys.exit()
     if not found_cards:
         return [], []
-    cards=[]
-    dis=[]
-    if(len(found_cards)<=num_of_cards):
-        num_of_cards = len(found_cards)
-    found_cards_copy=found_cards.copy()
-    for i in range(num_of_cards):
-        j = 0
-        for card in found_cards_copy:
-            if j==0:
-                j+=1
-                closest_card =card
-                closest_dis = distance(april_poses[tag_id], card_poses[closest_card])
-            temp_dis = distance(april_poses[tag_id], card_poses[card])
-            if(closest_dis > temp_dis):
-                closest_dis= temp_dis
-                closest_card = card
-        cards.append(closest_card)
-        dis.append(closest_dis)
-        found_cards_copy.remove(closest_card)
-
-    return cards,dis
+    hand = assign_cards(card_poses, april_poses, {tag_id: num_of_cards}, found_cards)
+    return hand.cards(tag_id), hand.distances(tag_id)
+
+def find_hands(april_poses, card_poses, found_cards, num_of_cards, num_dealer):
+    """
+    find_closest for the player (tag 1) and the dealer (tag 0) together,
+    a card close to both goes only to the closer one.
+    Returns (player cards, dealer cards).
+    """
+    for tag_id in (1, 0):
+        if tag_id not in april_poses:
+            print("couldnt find the tag")
+            sys.exit()
+    hands = assign_cards(card_poses, april_poses, {1: num_of_cards, 0: num_dealer}, found_cards)
+    return hands.cards(1), hands.cards(0)
+
+def cards_to_camera(card_poses, Z_ref):
+    """
+    card_poses[label] = [u, v] pixels -> {label: [X, Y, Z]} in meters, at the
+    depth of the tag. All the cards in one go (undistorted first when
+    point_undistorter is on).
+    """
+    if not card_poses:
+        return {}
+    labels = list(card_poses)
+    uv = np.array([card_poses[label] for label in labels], dtype=np.float64)
+    if point_undistorter is not None:
+        uv = point_undistorter.points(uv)
+    xyz = pixels_to_camera(uv, Z_ref, fx, fy, cx, cy)
+    return dict(zip(labels, xyz.tolist()))
+
+# the table plane of the last pose of tag_id_for_depth, see table_plane_for
+_table_plane = (None, None)
+
+
+def table_plane_for(april_poses):
+    """
+    The TablePlane of tag_id_for_depth, or None if the tag (or its
+    rotation) is missing. The tag cache hands out the same pose until the
+    tag is detected again, so the homography is only rebuilt then.
+    """
+    global _table_plane
+    pose = april_poses.get(tag_id_for_depth)
+    if pose is None:
+        return None
+    if _table_plane[0] is not pose:
+        _table_plane = (pose, TablePlane.from_pose(pose, camera_params))
+    return _table_plane[1]
+
+
+def cards_on_table(april_poses, card_poses):
+    """
+    (card_poses_3d, tag_poses_3d) in the frame of tag_id_for_depth (meters,
+    x, y on the table), from the tag's full pose. Falls back to the camera
+    frame at the depth of the tag (cards_to_camera) when there is no
+    rotation. Without the tag there is nothing to measure from: ({}, {}).
+    """
+    plane = table_plane_for(april_poses)
+    if plane is not None:
+        return plane.cards_to_table(card_poses, point_undistorter), plane.tags_to_table(april_poses)
+    if april_poses.get(tag_id_for_depth) is not None:
+        Z_ref = april_poses[tag_id_for_depth][2]  # z of the tag in meters
+        return cards_to_camera(card_poses, Z_ref), april_poses
+    return {}, {}
+
 
 def distance_for_hand(card_position,april_position,num_frames=30):
     print("move in x " + str(math.abs(april_position[0]-card_position[0])))
     print("move in y " + str(math.abs(april_position[1]-card_position[1])))
 
-def take_a_pic(num_of_cards,num_dealer,agent):
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-    if not cap.isOpened():
-        raise Exception("Could not open camera.")
-    frame_id = 0
-    number_of_images=0
-    my_cards={}
-    dealer_cards={}
-    while number_of_images!=100:
-        ret, frame = cap.read()
+def read_frames(cap, count):
+    """
+    Reads up to `count` frames from the camera.
+    Stops early (shorter list) if the camera fails.
+    """
+    frames = []
+    while len(frames) < count:
+        with metrics.span("capture"):
+            ret, frame = cap.read()
         if not ret:
             break
-        # detect AprilTags (and draw them)
-        frame_for_tags = frame.copy()
-        frame_with_tags, april_poses, found_tags = detect_apriltags(frame_for_tags, camera_params)
-
-        # run YOLO card detection
-        annotated_frame, card_poses, found_cards= discover_cards(
-            frame,  # use frame WITH TAG drawings
-            frame_id,
-            RUN_ID,
-        )
-        card_poses_3d = {}  # card_poses_3d[label] = [X, Y, Z] in meters
-        if tag_id_for_depth in april_poses:
-            Z_ref = april_poses[tag_id_for_depth][2]  # z of the tag in meters
-            for label, (u, v) in card_poses.items():
-                X, Y, Z = pixel_to_camera(u, v, Z_ref, fx, fy, cx, cy)
-                card_poses_3d[label] = [X, Y, Z]
+        frames.append(frame)
+    return frames
+
+
+def find_cards_roi(frames, tag_results, output_ids, gate=None):
+    """
+    ROI mode for a batch: YOLO only looks around the player/dealer tags.
+    The gate (if any) still skips frames where nothing moved.
+    """
+    indices = list(range(len(frames)))
+    if gate is not None:
+        indices, source = gate.split(frames)
+
+    inferred = [
+        discover_cards_roi(frames[i], tag_results[i][1], camera_params, output_ids[i], RUN_ID,
+                           with_confidence=True)
+        for i in indices
+    ]
+    if gate is not None:
+        return gate.fill(inferred, source)
+    return inferred
+
+
+def detection_stream(cap, count, batch_size=1, gate=None, roi=False, tracker=None, pipeline=None,
+                     tags=None, with_fresh=False):
+    """
+    Reads up to `count` frames and runs both detectors on every one.
+    Yields one ((frame_with_tags, april_poses, found_tags),
+                (annotated, card_poses, found_cards, card_confs)) per frame.
+    with_fresh=True adds a third item: False when the gate skipped the
+    frame and the card result is a reused one (tracked frames are fresh,
+    the tracker measured where the cards are now).
+
+    batch_size = how many frames go into one YOLO call.
+                 1 is the old frame-by-frame behaviour.
+    gate       = MotionGate that skips YOLO on frames where nothing moved,
+                 None runs YOLO on every frame.
+    roi        = True runs YOLO only on crops around tag 1 (player) and
+                 tag 0 (dealer) instead of the whole frame.
+    tracker    = CardTracker that runs YOLO every Nth frame and follows the
+                 cards with optical flow in between (then batch_size and
+                 gate are not used).
+    pipeline   = FramePipeline that runs the tag and card detection at the
+                 same time and reads the next frame meanwhile (frame by
+                 frame, so batch_size is not used). True makes one for
+                 this stream and shuts it down at the end.
+
+    Close the stream (stream.close()) when you stop reading it early, so
+    the frame the pipeline read ahead goes back to the source.
+    tags       = TagPoseCache that reuses the tag poses between frames,
+                 None runs the full tag detection on every frame.
+
+    No frame is copied: the detectors only read the camera's frame
+    (frame_with_tags is that same, clean frame), the card drawing goes to
+    a reused annotation buffer. Both the camera and the annotation buffers
+    keep enough frames for a whole batch, but only until the next batch,
+    so copy a frame if you keep it longer.
+    """
+    find_cards = gate.discover_cards if gate is not None else discover_cards_batch
+
+    # a batch (+ the frame the pipeline reads ahead) must stay valid while we work on it
+    in_flight = max(batch_size, 1) + 2
+    if hasattr(cap, "reserve"):
+        cap.reserve(in_flight)
+    drawimages.reserve_annotation_buffers(in_flight)
+
+    log = discover_cards_frames.detection_log
+    tag_ms = {}
+
+    def tags_for(frame, output_id):
+        # detect AprilTags on the frame itself, read only (nothing is drawn on it)
+        start = time.perf_counter()
+        if tags is not None:
+            result = tags.detect(frame, camera_params, draw=False)
+        else:
+            result = detect_apriltags(frame, camera_params, draw=False, undistorter=point_undistorter)
+        tag_ms[output_id] = (time.perf_counter() - start) * 1000
+        metrics.observe("tags_ms", tag_ms[output_id])
+        return result
+
+    def finished(output_id, tag_result):
+        metrics.inc("frames_processed")
+        # the card detector already logged its part of the frame
+        if log is not None:
+            found_by = {
+                tag_id: pose.found_by for tag_id, pose in tag_result[1].items()
+                if getattr(pose, "found_by", None) is not None
+            }
+            log.commit(output_id, tags=tag_result[1], tag_found_by=found_by,
+                       timing={"tags_ms": tag_ms.pop(output_id, None)})
+        else:
+            tag_ms.pop(output_id, None)
+
+    def cards_for(frame, output_id, tag_result=None):
+        with metrics.span("cards"):
+            return cards_once(frame, output_id, tag_result)
+
+    def cards_once(frame, output_id, tag_result=None):
+        # one frame of card detection, in whatever mode we are in
+        if tracker is not None:
+            if roi:
+                detect = lambda f: discover_cards_roi(f, tag_result[1], camera_params, output_id, RUN_ID,
+                                                      with_confidence=True)
+            else:
+                detect = lambda f: discover_cards(f, output_id, RUN_ID, with_confidence=True)
+            return tracker.update(frame, detect, with_confidence=True)
+        if roi:
+            return find_cards_roi([frame], [tag_result], [output_id], gate)[0]
+        return find_cards([frame], [output_id], RUN_ID, with_confidence=True)[0]
+
+    def fresh_flags(n):
+        # the gate only runs without the tracker, see cards_once
+        if gate is None or tracker is not None:
+            return [True] * n
+        return list(gate.last_fresh)
+
+    def result(tag_result, card_result, fresh):
+        if with_fresh:
+            return tag_result, card_result, fresh
+        return tag_result, card_result
+
+    gated_before = gate.frames_gated if gate is not None else 0
+
+    def count_gated():
+        nonlocal gated_before
+        if gate is not None and gate.frames_gated != gated_before:
+            metrics.inc("frames_gated", gate.frames_gated - gated_before)
+            gated_before = gate.frames_gated
+
+    if pipeline is not None:
+        # pipeline=True: a pipeline just for this stream, its threads stop with it
+        with (FramePipeline() if pipeline is True else nullcontext(pipeline)) as runner:
+            frames = runner.run(cap, count, tags_for, cards_for, cards_need_tags=roi, frame_ids=frame_counter)
+            try:
+                for output_id, frame, tag_result, card_result in frames:
+                    count_gated()
+                    finished(output_id, tag_result)
+                    yield result(tag_result, card_result, fresh_flags(1)[0])
+            finally:
+                # we may stop early, the frame read ahead goes back to the source
+                frames.close()
+        return
+
+    done = 0
+    while done < count:
+        frames = read_frames(cap, min(batch_size, count - done))
+        if not frames:
+            break
+        output_ids = [next(frame_counter) for _ in frames]
+        done += len(frames)
+
+        tag_results = [tags_for(frame, output_id) for frame, output_id in zip(frames, output_ids)]
+
+        # run YOLO card detection on the whole batch at once
+        start = time.perf_counter()
+        if tracker is not None:
+            card_results = [
+                cards_once(frame, output_id, tag_result)
+                for frame, output_id, tag_result in zip(frames, output_ids, tag_results)
+            ]
+        elif roi:
+            card_results = find_cards_roi(frames, tag_results, output_ids, gate)
         else:
-            card_poses_3d = {}
+            card_results = find_cards(frames, output_ids, RUN_ID, with_confidence=True)
+        # the batch shares the time, every frame gets its part
+        cards_ms = (time.perf_counter() - start) * 1000 / len(frames)
+        for _ in frames:
+            metrics.observe("cards_ms", cards_ms)
+        count_gated()
+        fresh = fresh_flags(len(frames))
+
+        for output_id, tag_result, card_result, is_fresh in zip(output_ids, tag_results, card_results, fresh):
+            finished(output_id, tag_result)
+            yield result(tag_result, card_result, is_fresh)
+
+
+def take_a_pic(num_of_cards,num_dealer,agent,batch_size=1,gate=None,roi=False,tracker=None,
+               pipeline=None,tags=tag_cache,min_frames=10,max_frames=100,confidence=0.95):
+    """
+    batch_size, gate, roi, tracker, pipeline, tags = how the frames are
+                 detected, see detection_stream.
+    min_frames, max_frames, confidence = when to stop looking: after at
+                 least min_frames fresh detections, as soon as both hands
+                 are stable with this confidence (see HandVote), and never
+                 after max_frames.
+
+    No gate by default: only fresh detections vote, and on a still table
+    the gate lets about one frame in max_skip through, so a gated round
+    never gets min_frames votes and always runs to max_frames. Ungated,
+    a clear hand is decided after min_frames frames.
+    """
+    # shared camera (or recording, see FRAME_SOURCE), stays open between calls
+    cap = open_camera()
+    # a new round: the first frame always runs YOLO, so there is at least
+    # one fresh vote even if the table looks like last time
+    if gate is not None:
+        gate.reset()
+    # same for the tracker, its tracks are the cards of the last hand
+    if tracker is not None:
+        tracker.reset()
+    number_of_images=0
+    my_vote = HandVote(num_of_cards, confidence, min_frames, max_frames)
+    dealer_vote = HandVote(num_dealer, confidence, min_frames, max_frames)
+    stream = detection_stream(cap, max_frames, batch_size, gate, roi, tracker, pipeline, tags, with_fresh=True)
+    for (_, april_poses, found_tags), (annotated_frame, card_poses, found_cards, card_confs), fresh in stream:
+        # card_poses_3d[label] = [X, Y, Z] in meters, on the table (tag 1 frame)
+        card_poses_3d, tag_poses_3d = cards_on_table(april_poses, card_poses)
 
-        for card in card_poses_3d.keys():
-            distance = distance(card_poses_3d[card], april_poses[2])
+        metrics.observe("cards_per_frame", len(found_cards))
 
         # Show the LIVE annotated view
-        cv2.imshow("Magic: Cards", annotated_frame)
-        cards, _ = find_closest(april_poses, card_poses_3d, found_cards, num_of_cards)
-        dealer_card,_=find_closest(april_poses, card_poses_3d, found_cards, num_dealer, tag_id=0)
-        for card in cards:
-            try:
-                my_cards[card]+=1
-            except:
-                my_cards[card]=1
-        for card in dealer_card:
-            try:
-                dealer_cards[card]+=1
-            except:
-                dealer_cards[card]=1
+        if not drawimages.headless:
+            cv2.imshow("Magic: Cards", live_view(annotated_frame))
+        with metrics.span("aggregate"):
+            cards, dealer_card = find_hands(tag_poses_3d, card_poses_3d, found_cards, num_of_cards, num_dealer)
+            # every fresh detection votes, weighted by how sure YOLO was
+            my_vote.add(cards, card_confs, fresh)
+            dealer_vote.add(dealer_card, card_confs, fresh)
 
         for card in found_cards:
             agent.update_count(card)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
         number_of_images+=1
+        if not drawimages.headless and cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+        # both hands settled, no need for more frames
+        if my_vote.is_stable() and dealer_vote.is_stable():
+            break
+    stream.close()
 
-    my_cards = sorted(my_cards.items(), key=lambda x: x[1], reverse=True)
-    dealer_cards=sorted(dealer_cards.items(), key=lambda x: x[1], reverse=True)
-    cards=[]
-    j=0
-    for card in my_cards:
-        if j<num_of_cards:
-            cards.append(card[0])
-        j+=1
-    j=0
-    dealer_card=[]
-    for card in dealer_cards:
-        if num_dealer>j:
-            dealer_card.append(card[0])
-        j+=1
-    cap.release()
-    cv2.destroyAllWindows()
+    cards = my_vote.top()
+    dealer_card = dealer_vote.top()
+    metrics.observe("frames_per_pic", number_of_images)
+    if not drawimages.headless:
+        cv2.destroyAllWindows()
     return dealer_card,cards
 
 
-def distance_checker_multi(num_frames=30):
+def distance_checker_multi(num_frames=30, batch_size=1, gate=None, pipeline=None, tags=None,
+                           card_positions=None, tag_positions=None):
     """
     Capture many frames and produce reliable:
       - card list
@@ -169,89 +464,64 @@ def distance_checker_multi(num_frames=30):
       - 3D card coordinates
       - distances between each card and each AprilTag
 
+    batch_size = how many frames go into one YOLO call (1 = frame by frame)
+    gate       = optional MotionGate, reuses the last detection while nothing moves
+    pipeline   = optional FramePipeline (or True), tags and cards run at the same time
+    tags       = optional TagPoseCache, reuses the tag poses between frames
+    card_positions, tag_positions = optional PositionAggregators to fill.
+                 Pass your own to read the estimates while we are still
+                 capturing (they can be read from another thread).
+
+    Every label keeps a fixed number of samples (see PositionAggregator),
+    so a long capture costs no more memory than a short one.
+
+    The coordinates are in the frame of tag_id_for_depth (x, y on the
+    table, see TablePlane), so the distances are measured on the table.
+
     Returns:
         distances, april_poses_3d, card_poses_3d
     """
 
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-    if not cap.isOpened():
-        raise Exception("Could not open camera.")
+    # shared camera (or recording, see FRAME_SOURCE), stays open between calls
+    cap = open_camera()
 
-    # stores many detections
-    card_seen_count = defaultdict(int)
-    card_xyz_list = defaultdict(list)
+    # robust running position of every card / tag
+    if card_positions is None:
+        card_positions = PositionAggregator()
+    if tag_positions is None:
+        tag_positions = PositionAggregator()
 
-    april_xyz_list = defaultdict(list)
+    # 1) Detect AprilTags + 2) Detect cards (YOLO)
+    stream = detection_stream(cap, num_frames, batch_size, gate, pipeline=pipeline, tags=tags)
+    for (_, april_poses, found_tags), (annotated, card_poses, found_cards, _) in stream:
+        # 3) Convert each card pixel → 3D on the table plane of the depth tag
+        card_xyz, tag_xyz = cards_on_table(april_poses, card_poses)
 
-    frame_id = 0
+        # store AprilTag and card 3D poses (multiple samples)
+        tag_positions.add_many(tag_xyz)
+        card_positions.add_many(card_xyz)
 
-    while frame_id < num_frames:
-        ret, frame = cap.read()
-        if not ret:
+        if not drawimages.headless and cv2.waitKey(1) & 0xFF == ord('q'):
             break
+    stream.close()
 
-        # 1) Detect AprilTags
-        frame_for_tags = frame.copy()
-        frame_with_tags, april_poses, found_tags = detect_apriltags(
-            frame_for_tags,
-            camera_params
-        )
-
-        # store AprilTag 3D poses (multiple samples)
-        for tag_id, pose3d in april_poses.items():
-            april_xyz_list[tag_id].append(pose3d)
-
-        # 2) Detect cards (YOLO)
-        annotated, card_poses, found_cards = discover_cards(
-            frame_with_tags,
-            output_id=frame_id,
-            RUN_ID=RUN_ID,
-            save_outputs=False
-        )
-
-        # 3) Convert each card pixel → 3D using AprilTag depth
-        if tag_id_for_depth in april_poses:
-            Z_ref = april_poses[tag_id_for_depth][2]
-
-            for label, (u, v) in card_poses.items():
-                X, Y, Z = pixel_to_camera(u, v, Z_ref, fx, fy, cx, cy)
-                card_xyz_list[label].append([X, Y, Z])
-                card_seen_count[label] += 1
-
-        frame_id += 1
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    if not drawimages.headless:
+        cv2.destroyAllWindows()
 
-    cap.release()
-    cv2.destroyAllWindows()
-
-    # 4) Aggregate AprilTag positions (median)
-    april_poses_3d = {
-        tag_id: np.median(np.array(samples), axis=0).tolist()
-        for tag_id, samples in april_xyz_list.items()
-    }
-
-    # 5) Aggregate card positions (median)
-    card_poses_3d = {
-        card: np.median(np.array(samples), axis=0).tolist()
-        for card, samples in card_xyz_list.items()
-        if card_seen_count[card] >= 3   # must appear in >=3 frames
-    }
-
-    # 6) Compute distances
-    distances = {}
-    for card, card_xyz in card_poses_3d.items():
-        distances[card] = {}
-
-        for tag_id, tag_xyz in april_poses_3d.items():
-            dx = card_xyz[0] - tag_xyz[0]
-            dy = card_xyz[1] - tag_xyz[1]
-            dist = math.sqrt(dx*dx + dy*dy)
-            distances[card][tag_id] = dist
+    # 4) Aggregate AprilTag positions (median without the outliers)
+    april_poses_3d = tag_positions.estimates()
+
+    # 5) Aggregate card positions (median without the outliers)
+    card_poses_3d = card_positions.estimates(min_count=3)   # must appear in >=3 frames
+
+    # 6) Compute distances (one card x tag matrix)
+    distances = assign_cards(card_poses_3d, april_poses_3d, {}).as_dict()
 
     for card_label, tag_distances in distances.items():
         print(card_label, tag_distances)
 
+    return distances, april_poses_3d, card_poses_3d
+
 
 
 
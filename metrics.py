@@ -0,0 +1,197 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+
+class RollingHistogram:
+    """
+    The last `window` values of something (ms of a stage, cards per frame...).
+    count and total keep counting forever, the percentiles only see the window.
+    """
+
+    def __init__(self, window=300):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentiles(self, qs=(50, 95, 99)):
+        if not self.values:
+            return [None for _ in qs]
+        return [float(p) for p in np.percentile(np.fromiter(self.values, dtype=np.float64), qs)]
+
+    def last(self):
+        return self.values[-1] if self.values else None
+
+
+class Metrics:
+    """
+    Counters and rolling histograms of the game loop.
+
+        with metrics.span("tags"):      # time a block, in ms
+            ...
+        metrics.observe("cards_per_frame", len(found_cards))
+        metrics.inc("frames_processed")
+
+    Recording is one lock + one deque append, so it can stay on in the hot
+    path. Read it with snapshot(), prometheus_text() (see serve()) or
+    draw_overlay() on the imshow frame.
+    """
+
+    def __init__(self, window=300):
+        self.window = window
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    # ------------------------------------------------------
+    # recording
+    # ------------------------------------------------------
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name + "_ms", (time.perf_counter() - start) * 1000)
+
+    def observe(self, name, value):
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = RollingHistogram(self.window)
+                self.histograms[name] = hist
+            hist.add(value)
+
+    def inc(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # ------------------------------------------------------
+    # reading
+    # ------------------------------------------------------
+    def snapshot(self):
+        with self.lock:
+            histograms = {}
+            for name, hist in self.histograms.items():
+                p50, p95, p99 = hist.percentiles()
+                histograms[name] = {
+                    "last": hist.last(), "p50": p50, "p95": p95, "p99": p99,
+                    "count": hist.count, "sum": hist.total,
+                }
+            return {"counters": dict(self.counters), "histograms": histograms}
+
+    def prometheus_text(self, prefix="magic"):
+        """The snapshot in the Prometheus text format (counters + summaries)."""
+        snap = self.snapshot()
+        lines = []
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name} {value}")
+        for name, h in sorted(snap["histograms"].items()):
+            lines.append(f"# TYPE {prefix}_{name} summary")
+            for q, key in ((0.5, "p50"), (0.95, "p95"), (0.99, "p99")):
+                if h[key] is not None:
+                    lines.append(f'{prefix}_{name}{{quantile="{q}"}} {h[key]:.3f}')
+            lines.append(f"{prefix}_{name}_sum {h['sum']:.3f}")
+            lines.append(f"{prefix}_{name}_count {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def draw_overlay(self, img, names=None, origin=(10, 25)):
+        """
+        Writes the p50 / p95 of the histograms (all, or only `names`) and the
+        counters in the top left corner of img.
+        """
+        snap = self.snapshot()
+        lines = []
+        for name, h in sorted(snap["histograms"].items()):
+            if names is not None and name not in names:
+                continue
+            if h["p50"] is not None:
+                lines.append(f"{name}: {h['p50']:.1f} / {h['p95']:.1f}")
+        for name, value in sorted(snap["counters"].items()):
+            if names is None or name in names:
+                lines.append(f"{name}: {value}")
+
+        x, y = origin
+        for line in lines:
+            # black outline so it is readable on any table
+            cv2.putText(img, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 3)
+            cv2.putText(img, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            y += 20
+        return img
+
+    # ------------------------------------------------------
+    # http endpoint
+    # ------------------------------------------------------
+    def serve(self, port=9100, host="127.0.0.1"):
+        """Serves prometheus_text() on http://host:port/metrics from a background thread."""
+        if self.server is not None:
+            return self.server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass   # dont spam the console on every scrape
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"metrics on http://{host}:{port}/metrics")
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+# ----------------------------------------------------
+# one Metrics for the whole process
+# MAGIC_METRICS_PORT=9100 also serves it over http
+# ----------------------------------------------------
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+            port = os.environ.get("MAGIC_METRICS_PORT")
+            if port:
+                _metrics.serve(int(port))
+        return _metrics
+
+
+def close_metrics():
+    with _metrics_lock:
+        if _metrics is not None:
+            _metrics.close()
+
+
+atexit.register(close_metrics)
@@ -0,0 +1,126 @@
+import cv2
+
+from discover_cards_frames import discover_cards_batch
+
+
+class MotionGate:
+    """
+    Cheap "did the table change?" check in front of discover_cards.
+
+    Every frame is shrunk to a tiny grayscale image and compared (absdiff)
+    to the last frame we actually ran YOLO on. If almost no pixels moved
+    the table did not change, so we reuse the last detection instead of
+    running the model again.
+
+    threshold = pixel difference (0-255) that counts as a changed pixel
+    min_area  = part of the image (0-1) that must change to fire the gate.
+                one new card is about 1% of the frame, so keep it below that
+    size      = size of the tiny image we compare (w, h)
+    max_skip  = run YOLO anyway after this many gated frames in a row,
+                so a slow drift can never freeze the result forever
+    """
+
+    def __init__(self, threshold=25, min_area=0.003, size=(160, 90), max_skip=50):
+        self.threshold = threshold
+        self.min_area = min_area
+        self.size = size
+        self.max_skip = max_skip
+
+        self.reference = None      # tiny gray image of the last inferred frame
+        self.last_result = None    # what discover_cards returned for it
+        self.skipped_in_row = 0
+        # for every frame of the last split(): True = it went to YOLO,
+        # False = it gets a result we already had
+        self.last_fresh = []
+
+        # counters
+        self.frames_gated = 0      # reused the old result
+        self.frames_inferred = 0   # ran YOLO
+
+    def _small_gray(self, frame):
+        # shrink first, so no full size gray copy of the frame is made
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def changed(self, frame):
+        """
+        True if this frame needs a new detection.
+        When it returns True the frame becomes the new reference.
+        """
+        small = self._small_gray(frame)
+
+        if self.reference is None or self.skipped_in_row >= self.max_skip:
+            changed = True
+        else:
+            diff = cv2.absdiff(small, self.reference)
+            moved = cv2.countNonZero(cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)[1])
+            changed = moved > self.min_area * diff.size
+
+        if changed:
+            self.reference = small
+            self.skipped_in_row = 0
+            self.frames_inferred += 1
+        else:
+            self.skipped_in_row += 1
+            self.frames_gated += 1
+        return changed
+
+    def split(self, frames):
+        """
+        Decides which frames need YOLO.
+        Returns (to_infer, source): indices of the frames to run, and for
+        every frame the index into to_infer whose result it should get
+        (-1 = the result from before this batch).
+        """
+        source = []
+        to_infer = []
+        fresh = []
+        for i, frame in enumerate(frames):
+            changed = self.changed(frame)
+            if changed:
+                to_infer.append(i)
+            source.append(len(to_infer) - 1)
+            fresh.append(changed)
+        self.last_fresh = fresh
+        return to_infer, source
+
+    def fill(self, inferred, source):
+        """Spreads the results of the inferred frames over all the frames."""
+        results = []
+        for s in source:
+            results.append(inferred[s] if s >= 0 else self.last_result)
+
+        if inferred:
+            self.last_result = inferred[-1]
+        return results
+
+    def discover_cards(self, frames, output_ids, RUN_ID, save_outputs=False, with_confidence=False):
+        """
+        Drop-in for discover_cards_batch.
+        Only the frames that changed go to YOLO, every other frame gets
+        the result of the last frame that did (see last_fresh for which).
+        """
+        to_infer, source = self.split(frames)
+        inferred = discover_cards_batch(
+            [frames[i] for i in to_infer],
+            [output_ids[i] for i in to_infer],
+            RUN_ID,
+            save_outputs,
+            with_confidence,
+        )
+        return self.fill(inferred, source)
+
+    def reset(self):
+        """Forget the reference frame, the next frame always runs YOLO."""
+        self.reference = None
+        self.last_result = None
+        self.skipped_in_row = 0
+        self.last_fresh = []
+
+    def stats(self):
+        total = self.frames_gated + self.frames_inferred
+        return {
+            "frames_gated": self.frames_gated,
+            "frames_inferred": self.frames_inferred,
+            "gated_ratio": self.frames_gated / total if total else 0.0,
+        }
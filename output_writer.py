@@ -0,0 +1,169 @@
+import atexit
+import os
+import threading
+from collections import deque
+
+import cv2
+
+
+class OutputWriter:
+    """
+    Writes our result files (marked JPEGs, reports) on a background thread,
+    so saving never slows the camera loop.
+
+    Jobs wait in a bounded queue (max_queue). When it is full:
+      drop_policy = "drop_newest" -> the new job is thrown away
+                    "drop_oldest" -> the oldest waiting job is thrown away
+                    "block"       -> the caller waits for a free spot
+
+    flush() waits until everything queued is on disk, close() flushes and
+    stops the thread. The shared writer is closed (flushed) on exit.
+    """
+
+    def __init__(self, max_queue=32, drop_policy="drop_newest"):
+        if drop_policy not in ("drop_newest", "drop_oldest", "block"):
+            raise ValueError(f"unknown drop policy {drop_policy}")
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+
+        self.jobs = deque()
+        self.cond = threading.Condition()
+        self.busy = False          # the thread is writing a job right now
+        self.running = True
+
+        # counters
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    # ------------------------------------------------------
+    # producer side (the hot path, only queues)
+    # ------------------------------------------------------
+    def save_image(self, path, img, params=None):
+        """Queue a cv2.imwrite. img must not be changed after this call."""
+        return self._put(("image", path, img, params or []))
+
+    def save_text(self, path, text, append=False):
+        return self._put(("text", path, text, "a" if append else "w"))
+
+    def save_frame(self, video_writer, path, img):
+        """
+        Queue a video_writer.write(img), path is the video (for the error
+        message). The jobs run in order, so the frames stay in order.
+        """
+        return self._put(("frame", path, img, video_writer))
+
+    def _put(self, job):
+        with self.cond:
+            if not self.running:
+                return False
+            if len(self.jobs) >= self.max_queue:
+                if self.drop_policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                if self.drop_policy == "drop_oldest":
+                    self.jobs.popleft()
+                    self.dropped += 1
+                else:
+                    self.cond.wait_for(lambda: len(self.jobs) < self.max_queue or not self.running)
+                    if not self.running:
+                        return False
+            self.jobs.append(job)
+            self.cond.notify_all()
+            return True
+
+    # ------------------------------------------------------
+    # writer thread
+    # ------------------------------------------------------
+    def _write_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.jobs or not self.running)
+                if not self.jobs:
+                    return   # stopped and nothing left
+                job = self.jobs.popleft()
+                self.busy = True
+                self.cond.notify_all()
+
+            try:
+                self._write(job)
+                ok = True
+            except Exception as e:
+                print(f"OutputWriter: could not write {job[1]}: {e}")
+                ok = False
+
+            with self.cond:
+                self.busy = False
+                if ok:
+                    self.written += 1
+                else:
+                    self.failed += 1
+                self.cond.notify_all()
+
+    @staticmethod
+    def _write(job):
+        kind, path, data, extra = job
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if kind == "image":
+            if not cv2.imwrite(path, data, extra):
+                raise IOError("imwrite failed")
+        elif kind == "frame":
+            extra.write(data)
+        else:
+            with open(path, extra) as f:
+                f.write(data)
+
+    # ------------------------------------------------------
+    # shutdown
+    # ------------------------------------------------------
+    def flush(self, timeout=None):
+        """Wait until every queued job is written. False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.jobs and not self.busy, timeout=timeout)
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=timeout)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "queued": len(self.jobs),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+
+# ----------------------------------------------------
+# one writer for the whole process
+# ----------------------------------------------------
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_output_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = OutputWriter()
+        return _writer
+
+
+def close_output_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+atexit.register(close_output_writer)
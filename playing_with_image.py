@@ -1,6 +1,10 @@
+import time
 from game_env import Deck, utility, hand_value
 from bj_player import Agent
 from make_the_magic import take_a_pic
+from metrics import get_metrics
+
+metrics = get_metrics()
 
 
 def dealer_play(agent,num_of_cards, dealer_card,dealer_num=2):
@@ -34,13 +38,19 @@ def play_round(agent, deck,num_of_cards):
     # Allocate units (abstract weight)
 
     # 5. Agent’s hit/stand loop
+    hit_time = None
     while True:
         print("its my turn")
-        action = agent.decide_action(my_cards, deck, dealer_card)
+        with metrics.span("decision"):
+            action = agent.decide_action(my_cards, deck, dealer_card)
+        if hit_time is not None:
+            # from the new card on the table to our next move
+            metrics.observe("hit_to_decision_ms", (time.perf_counter() - hit_time) * 1000)
         if action == "stand":
             break
 
         input("hit me")
+        hit_time = time.perf_counter()
         num_of_cards+=1
         _, my_cards = take_a_pic(num_of_cards,1, agent)
 
@@ -6,6 +6,14 @@ from collections import defaultdict
 import math
 from discover_cards_frames import discover_cards,pixel_to_camera
 from april_tags_frames import detect_apriltags
+from frame_source import get_frame_source
+from calibration_profile import get_profile
+
+# same calibration as the game (see calibration_profile.py)
+camera_params = get_profile().camera_params
+fx, fy, cx, cy = camera_params
+
+
 def distance_checker():
     """
     Detect all cards + all AprilTags in a single frame,
@@ -23,17 +31,13 @@ def distance_checker():
         april_poses_3d,   # {tag_id: [X,Y,Z]}
         card_poses_3d     # {card_label: [X,Y,Z]}
     """
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-    if not cap.isOpened():
-        raise Exception("Could not open camera.")
+    # shared camera (or recording, see FRAME_SOURCE), already warmed up if someone used it before us
+    cap = get_frame_source()
 
     ret, frame = cap.read()
     if not ret:
-        cap.release()
         raise Exception("Could not capture frame.")
 
-    cap.release()
-
     # 1) Detect AprilTags
     frame_for_tags = frame.copy()
     frame_with_tags, april_poses, found_tags = detect_apriltags(
@@ -0,0 +1,125 @@
+import threading
+
+import numpy as np
+
+# MAD -> standard deviation for normal noise
+MAD_TO_SIGMA = 1.4826
+
+
+class RobustPosition:
+    """
+    Where one object (a card, a tag) is, from many noisy samples, in a
+    fixed amount of memory.
+
+    Keeps a reservoir of at most `size` samples: the first `size` go in
+    directly, after that sample n replaces a random slot with probability
+    size / n. So the reservoir is always a uniform pick of everything we
+    saw, no matter how long we run.
+
+    estimate() is the median of the reservoir after dropping the samples
+    that are more than k MADs (per axis) away from the median, e.g. a
+    frame where YOLO put the box on the wrong card.
+    """
+
+    def __init__(self, size=64, dims=3, k=3.0, rng=None):
+        self.samples = np.empty((size, dims))
+        self.k = k
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = 0          # samples seen (not only kept)
+        self.rejected = 0       # outliers dropped by the last estimate
+        self._estimate = None   # cached until the next add
+
+    def add(self, xyz):
+        size = len(self.samples)
+        if self.count < size:
+            self.samples[self.count] = xyz
+        else:
+            j = self.rng.integers(0, self.count + 1)
+            if j < size:
+                self.samples[j] = xyz
+        self.count += 1
+        self._estimate = None
+
+    def kept(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def estimate(self):
+        """Robust median as an array, None before the first sample."""
+        if self.count == 0:
+            return None
+        if self._estimate is None:
+            s = self.kept()
+            med = np.median(s, axis=0)
+            dev = np.abs(s - med)
+            mad = np.median(dev, axis=0) * MAD_TO_SIGMA
+            # all samples equal on an axis -> mad 0, keep the ones on the median
+            inliers = np.all(dev <= self.k * np.maximum(mad, 1e-12), axis=1)
+            self.rejected = int(len(s) - inliers.sum())
+            self._estimate = np.median(s[inliers], axis=0) if inliers.any() else med
+        return self._estimate
+
+
+class PositionAggregator:
+    """
+    RobustPosition for every label (card label or tag id), filled frame by
+    frame. Memory is O(size) per label however many frames go in, and the
+    estimates can be read at any time, also from another thread while the
+    capture is still running.
+
+        cards = PositionAggregator()
+        cards.add_many(card_poses_3d)          # every frame
+        cards.estimates(min_count=3)           # whenever we want
+
+    size     = samples kept per label
+    k        = outlier threshold in MADs
+    seed     = for the reservoir (same input -> same estimates)
+    """
+
+    def __init__(self, size=64, dims=3, k=3.0, seed=0):
+        self.size = size
+        self.dims = dims
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.positions = {}
+        self.lock = threading.Lock()
+
+    def add(self, label, xyz):
+        if xyz is None:
+            return
+        with self.lock:
+            position = self.positions.get(label)
+            if position is None:
+                position = RobustPosition(self.size, self.dims, self.k, self.rng)
+                self.positions[label] = position
+            position.add(xyz)
+
+    def add_many(self, poses):
+        """poses[label] = [x, y, z], e.g. one frame of card_poses_3d."""
+        for label, xyz in poses.items():
+            self.add(label, xyz)
+
+    def count(self, label):
+        with self.lock:
+            position = self.positions.get(label)
+            return position.count if position is not None else 0
+
+    def estimates(self, min_count=1):
+        """{label: [x, y, z]} for every label seen at least min_count times."""
+        with self.lock:
+            return {
+                label: position.estimate().tolist()
+                for label, position in self.positions.items()
+                if position.count >= min_count
+            }
+
+    def stats(self):
+        with self.lock:
+            return {
+                label: {"seen": position.count, "kept": len(position.kept()),
+                        "rejected": position.rejected}
+                for label, position in self.positions.items()
+            }
+
+    def clear(self):
+        with self.lock:
+            self.positions.clear()
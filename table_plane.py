@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class TablePlane:
+    """
+    The table, seen through one AprilTag taped flat on it.
+
+    The tag pose (R, t) tells where the tag plane is: a point (X, Y, 0) of
+    the tag frame is at R @ (X, Y, 0) + t in the camera frame. Every pixel
+    on that plane comes from the homography
+
+        H = K @ [r1 r2 t]      (r1, r2 = first two columns of R)
+
+    so going back from pixels to the table is just H^-1, built once per
+    tag pose and then applied to all the cards in one matrix product.
+    Unlike pixel_to_camera (every card at the depth of the tag) this also
+    holds when the camera looks at the table at an angle.
+
+    The results are in the tag frame, in meters: x, y on the table around
+    the tag center and z = 0.
+    """
+
+    def __init__(self, R, t, camera_params):
+        fx, fy, cx, cy = camera_params
+        self.R = np.asarray(R, dtype=np.float64).reshape(3, 3)
+        self.t = np.asarray(t, dtype=np.float64).reshape(3)
+        K = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float64)
+        H = K @ np.column_stack((self.R[:, 0], self.R[:, 1], self.t))
+        self.H_inv = np.linalg.inv(H)
+
+    @classmethod
+    def from_pose(cls, pose, camera_params):
+        """From a tag pose of detect_apriltags (needs its rotation, pose.R)."""
+        if pose is None or getattr(pose, "R", None) is None:
+            return None
+        return cls(pose.R, pose, camera_params)
+
+    def pixels_to_table(self, uv):
+        """(N, 2) pixels -> (N, 3) tag frame coordinates, z = 0."""
+        uv = np.asarray(uv, dtype=np.float64).reshape(-1, 2)
+        xyw = uv @ self.H_inv[:, :2].T + self.H_inv[:, 2]
+        xyz = np.zeros((len(uv), 3))
+        xyz[:, :2] = xyw[:, :2] / xyw[:, 2:3]
+        return xyz
+
+    def camera_to_table(self, xyz):
+        """(N, 3) camera frame points -> (N, 3) tag frame (e.g. the other tags)."""
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        # R is orthonormal, R^-1 = R^T; row vectors -> (p - t) @ R
+        return (xyz - self.t) @ self.R
+
+    def table_to_camera(self, xyz):
+        """(N, 3) tag frame -> (N, 3) camera frame."""
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        return xyz @ self.R.T + self.t
+
+    # ------------------------------------------------------
+    # dict in, dict out (card_poses / april_poses)
+    # ------------------------------------------------------
+    def cards_to_table(self, card_poses, undistorter=None):
+        """
+        card_poses[label] = [u, v] -> {label: [x, y, 0]} on the table.
+        undistorter = optional PointUndistorter for the pixels first.
+        """
+        if not card_poses:
+            return {}
+        labels = list(card_poses)
+        uv = np.array([card_poses[label] for label in labels], dtype=np.float64)
+        if undistorter is not None:
+            uv = undistorter.points(uv)
+        return dict(zip(labels, self.pixels_to_table(uv).tolist()))
+
+    def tags_to_table(self, april_poses):
+        """april_poses[tag_id] = [x, y, z] camera frame -> the same in the tag frame."""
+        ids = [tag_id for tag_id, pose in april_poses.items() if pose is not None]
+        if not ids:
+            return {}
+        xyz = self.camera_to_table([list(april_poses[tag_id]) for tag_id in ids])
+        return dict(zip(ids, xyz.tolist()))
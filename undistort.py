@@ -0,0 +1,191 @@
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+from frame_buffers import BufferRing
+
+MAPS_FOLDER = "results/undistort_maps"
+
+
+class Undistorter:
+    """
+    Removes the lens distortion from whole frames with cv2.remap.
+
+    K, D    = camera matrix and distortion coefficients from the calibration
+    size    = (width, height) of the frames
+    model   = "standard" (cv2.calibrateCamera, 4-14 coefficients)
+              "fisheye"  (cv2.fisheye.calibrate, 4 coefficients)
+    balance = 0 crops to valid pixels only, 1 keeps the whole field of view
+    folder  = where the maps are cached, None = build them every time
+
+    The remap tables only depend on (K, D, size, model, balance), so they are
+    built once and saved as .npy files in MAPS_FOLDER. The next start loads
+    them memory mapped instead of computing them again.
+
+    After undistortion the image has a new camera matrix (new_K), so
+    everything that works on undistorted frames (tag poses, pixel_to_camera)
+    must use camera_params of this object instead of the raw K.
+    """
+
+    def __init__(self, K, D, size, model="standard", balance=0.0, folder=MAPS_FOLDER, keep=4):
+        if model not in ("standard", "fisheye"):
+            raise ValueError(f"unknown camera model {model}")
+        self.K = np.asarray(K, dtype=np.float64).reshape(3, 3)
+        self.D = np.asarray(D, dtype=np.float64).reshape(-1, 1)
+        self.size = (int(size[0]), int(size[1]))
+        self.model = model
+        self.balance = float(balance)
+        self.folder = folder
+        # undistorted frames, reused like the camera's (see CameraSession)
+        self.buffers = BufferRing(keep)
+
+        self.new_K, self.map1, self.map2 = self._load_or_build()
+
+    # ------------------------------------------------------
+    # maps
+    # ------------------------------------------------------
+    def cache_key(self):
+        h = hashlib.sha1()
+        h.update(self.model.encode())
+        h.update(self.K.tobytes())
+        h.update(self.D.tobytes())
+        h.update(np.array(self.size + (self.balance,), dtype=np.float64).tobytes())
+        return h.hexdigest()[:16]
+
+    def _paths(self):
+        base = os.path.join(self.folder, f"{self.model}_{self.size[0]}x{self.size[1]}_{self.cache_key()}")
+        return base + "_newK.npy", base + "_map1.npy", base + "_map2.npy"
+
+    def _load_or_build(self):
+        # folder=None -> no disk cache, always build
+        if not self.folder:
+            return self.build_maps()
+
+        paths = self._paths()
+        if all(os.path.exists(p) for p in paths):
+            new_K = np.load(paths[0])
+            map1 = np.load(paths[1], mmap_mode="r")
+            map2 = np.load(paths[2], mmap_mode="r")
+            return new_K, map1, map2
+
+        new_K, map1, map2 = self.build_maps()
+        os.makedirs(self.folder, exist_ok=True)
+        for path, arr in zip(paths, (new_K, map1, map2)):
+            np.save(path, arr)
+        return new_K, map1, map2
+
+    def build_maps(self):
+        """(new_K, map1, map2) for this camera, computed from scratch."""
+        if self.model == "fisheye":
+            new_K = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(
+                self.K, self.D, self.size, np.eye(3), balance=self.balance
+            )
+            map1, map2 = cv2.fisheye.initUndistortRectifyMap(
+                self.K, self.D, np.eye(3), new_K, self.size, cv2.CV_16SC2
+            )
+        else:
+            new_K, _ = cv2.getOptimalNewCameraMatrix(self.K, self.D, self.size, self.balance, self.size)
+            map1, map2 = cv2.initUndistortRectifyMap(
+                self.K, self.D, None, new_K, self.size, cv2.CV_16SC2
+            )
+        return new_K, map1, map2
+
+    @property
+    def camera_params(self):
+        """[fx, fy, cx, cy] of the undistorted frames."""
+        return [float(self.new_K[0, 0]), float(self.new_K[1, 1]),
+                float(self.new_K[0, 2]), float(self.new_K[1, 2])]
+
+    # ------------------------------------------------------
+    # frames
+    # ------------------------------------------------------
+    def undistort(self, frame, dst=None):
+        """
+        The undistorted frame. Without dst it goes into a reused buffer,
+        valid for the next `keep` calls.
+        """
+        h, w = frame.shape[:2]
+        if (w, h) != self.size:
+            raise ValueError(f"frame is {w}x{h} but the maps are for {self.size[0]}x{self.size[1]}")
+        if dst is None:
+            dst = self.buffers.like(frame)
+        return cv2.remap(frame, self.map1, self.map2, interpolation=cv2.INTER_LINEAR, dst=dst)
+
+    def reserve(self, keep):
+        self.buffers.reserve(keep)
+
+
+class UndistortedSource:
+    """
+    A frame source (camera / recording) that hands out undistorted frames.
+    Same read() / isOpened() / release() as the source it wraps.
+    """
+
+    def __init__(self, source, undistorter):
+        self.source = source
+        self.undistorter = undistorter
+        self.last = (None, None)     # (raw, undistorted) of the last read
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def read(self):
+        ret, frame = self.source.read()
+        if not ret:
+            return ret, frame
+        undistorted = self.undistorter.undistort(frame)
+        self.last = (frame, undistorted)
+        return True, undistorted
+
+    def unread(self, frame):
+        # hand the raw frame back, we undistort it again if it comes back
+        raw, undistorted = self.last
+        if frame is undistorted and hasattr(self.source, "unread"):
+            self.source.unread(raw)
+        self.last = (None, None)
+
+    def reserve(self, keep):
+        self.undistorter.reserve(keep)
+        if hasattr(self.source, "reserve"):
+            self.source.reserve(keep)
+
+    def release(self):
+        self.source.release()
+
+    def close(self):
+        if hasattr(self.source, "close"):
+            self.source.close()
+
+
+class PointUndistorter:
+    """
+    Undistorts only some pixels (card centers, tag corners) instead of the
+    whole frame: one cv2.undistortPoints call for all of them.
+
+    The points come back as pixels of a perfect pinhole camera with the
+    same K, so fx, fy, cx, cy / camera_params stay the calibrated ones.
+    """
+
+    def __init__(self, K, D, model="standard"):
+        if model not in ("standard", "fisheye"):
+            raise ValueError(f"unknown camera model {model}")
+        self.K = np.asarray(K, dtype=np.float64).reshape(3, 3)
+        self.D = np.asarray(D, dtype=np.float64).reshape(-1, 1)
+        self.model = model
+
+    def points(self, pts):
+        """(N, 2) distorted pixels -> (N, 2) undistorted pixels."""
+        pts = np.asarray(pts, dtype=np.float64).reshape(-1, 1, 2)
+        if len(pts) == 0:
+            return pts.reshape(0, 2)
+        if self.model == "fisheye":
+            out = cv2.fisheye.undistortPoints(pts, self.K, self.D, P=self.K)
+        else:
+            out = cv2.undistortPoints(pts, self.K, self.D, P=self.K)
+        return out.reshape(-1, 2)
+
+    @property
+    def camera_params(self):
+        return [float(self.K[0, 0]), float(self.K[1, 1]), float(self.K[0, 2]), float(self.K[1, 2])]
@@ -1,19 +1,16 @@
+import os
+import sys
 import cv2
 from pupil_apriltags import Detector
 
-# our digital camera calibration data
-K = [
-    [1.39561099e+03, 0.00000000e+00, 8.85690305e+02],
-    [0.00000000e+00, 1.38830766e+03, 5.04754597e+02],
-    [0.00000000e+00, 0.00000000e+00, 1.00000000e+00],
-]
+# so we can import the modules from the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_source import get_frame_source
+from calibration_profile import get_profile
 
-D = [-0.07011441, 0.24724181, 0.00124205, -0.00364551, -0.27059026]
-
-fx = K[0][0]
-fy = K[1][1]
-cx = K[0][2]
-cy = K[1][2]
+# our digital camera calibration data (see calibration_profile.py)
+profile = get_profile()
+fx, fy, cx, cy = profile.camera_params
 
 camera_params = [fx, fy, cx, cy]
 TAG_SIZE = 0.08  # 8 cm tag
@@ -33,11 +30,9 @@ detector = Detector(
     decode_sharpening=0.25,
 )
 
-#open the camera
-cap = cv2.VideoCapture(0)
+#open the camera (shared session, grabs frames in the background)
 # force cv to run on our camera proportion 1920 1080
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+cap = get_frame_source(0, api=None, width=1920, height=1080)
 
 # take one image to check if its crashing
 ret, frame = cap.read()
@@ -124,5 +119,5 @@ while True:
     if cv2.waitKey(1) & 0xFF == ord("q"):
         break
 
-cap.release()
+cap.close()
 cv2.destroyAllWindows()
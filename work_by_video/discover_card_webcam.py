@@ -1,9 +1,15 @@
 import cv2
 import os
+import sys
 import time
 from ultralytics import YOLO
 from collections import defaultdict
 
+# so we can import the modules from the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_source import get_frame_source
+from output_writer import get_output_writer
+
 # ----------------------------------------------------
 # Setup folders
 # ----------------------------------------------------
@@ -44,6 +50,9 @@ def discover_cards(image_or_frame, output_id, live=False):
     """
     If live=True → image_or_frame is a frame (numpy array)
     If live=False → image_or_frame is a file path
+
+    Returns (annotated image, cards, pair_centers). Saved frames go through
+    the background writer, so saving does not slow the live view.
     """
 
     if live:
@@ -107,45 +116,53 @@ def discover_cards(image_or_frame, output_id, live=False):
 
     # Save outputs (only for saved frames, not live frames)
     if not live:
-        mark_path = f"results/marked/frame_{RUN_ID}_{output_id:04d}_marked.jpg"
-        text_path = f"results/texts/frame_{RUN_ID}_{output_id:04d}.txt"
+        save_outputs(img, make_report(output_id, cards, pair_centers), output_id)
+
+    return img, cards, pair_centers  # annotated image (used for live display) + what we found
+
+
+def make_report(output_id, cards, pair_centers):
+    lines = [
+        f"Run {RUN_ID}, Frame {output_id}\n",
+        "===========================\n\n",
+        "Detected cards:\n\n",
+    ]
+    for c in cards:
+        lines.append(f"Card: {c['label']}\n")
+        lines.append(f"Edges: {c['edges']}\n")
+        lines.append(f"Center: {c['center']}\n\n")
 
-        cv2.imwrite(mark_path, img)
+    lines.append("\nPairs (2 cards):\n")
+    for p in pair_centers:
+        lines.append(f"{p['Card']}: middle = {p['middle']}\n")
 
-        with open(text_path, "w") as f:
-            f.write(f"Run {RUN_ID}, Frame {output_id}\n")
-            f.write("===========================\n\n")
-            f.write("Detected cards:\n\n")
-            for c in cards:
-                f.write(f"Card: {c['label']}\n")
-                f.write(f"Edges: {c['edges']}\n")
-                f.write(f"Center: {c['center']}\n\n")
+    # set of labels that appear in pairs
+    paired_labels = {p["Card"] for p in pair_centers}
 
-            f.write("\nPairs (2 cards):\n")
-            for p in pair_centers:
-                f.write(f"{p['Card']}: middle = {p['middle']}\n")
+    lines.append("\n1-Card (no pair center):\n\n")
 
-            # set of labels that appear in pairs
-            paired_labels = {p["Card"] for p in pair_centers}
+    for c in cards:
+        if c["label"] not in paired_labels:
+            lines.append(f"Card: {c['label']}\n")
+            lines.append(f"Edges: {c['edges']}\n")
+            lines.append(f"Center: {c['center']}\n\n")
+    return "".join(lines)
 
-            f.write("\n1-Card (no pair center):\n\n")
 
-            for c in cards:
-                if c["label"] not in paired_labels:
-                    f.write(f"Card: {c['label']}\n")
-                    f.write(f"Edges: {c['edges']}\n")
-                    f.write(f"Center: {c['center']}\n\n")
+def save_outputs(img, report, output_id):
+    mark_path = f"results/marked/frame_{RUN_ID}_{output_id:04d}_marked.jpg"
+    text_path = f"results/texts/frame_{RUN_ID}_{output_id:04d}.txt"
 
-    return img  # Return annotated image (used for live display)
+    writer.save_image(mark_path, img)
+    writer.save_text(text_path, report)
 
 
 
 # ----------------------------------------------------
 # WEBCAM LOOP — 2 frames per second
 # ----------------------------------------------------
-cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-if not cap.isOpened():
-    raise Exception("Could not open camera.")
+cap = get_frame_source()
+writer = get_output_writer()
 
 frame_id = 0
 last_time = time.time()
@@ -157,7 +174,7 @@ while True:
         break
 
     # Live processed frame (drawn markings)
-    live_annotated = discover_cards(frame, frame_id, live=True)
+    live_annotated, live_cards, live_pairs = discover_cards(frame, frame_id, live=True)
 
     now = time.time()
     if now - last_time >= CAPTURE_INTERVAL:
@@ -166,10 +183,12 @@ while True:
 
         # Save original frame
         photo_path = f"results/photos/frame_{RUN_ID}_{frame_id:04d}.jpg"
-        cv2.imwrite(photo_path, frame)
+        # the camera reuses its frame buffers, the writer gets its own copy
+        writer.save_image(photo_path, frame.copy())
 
-        # Process and save file outputs
-        discover_cards(photo_path, frame_id, live=False)
+        # save the detection we already have, no need to read the photo
+        # back and run YOLO on it again
+        save_outputs(live_annotated, make_report(frame_id, live_cards, live_pairs), frame_id)
 
     # Show the LIVE annotated view
     cv2.imshow("Card Detector Live", live_annotated)
@@ -177,5 +196,6 @@ while True:
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
-cap.release()
+cap.close()
+writer.flush()
 cv2.destroyAllWindows()